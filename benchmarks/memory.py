@@ -0,0 +1,57 @@
+'''
+Memory used per cell. To run:
+
+    ./venv/bin/python benchmarks/memory.py [cells]
+
+Builds a ReadableHub with ``cells`` rows (one million by default) and
+a ComputableHub with a ComputedCell per row, each reading its row and
+a shared toggle from a QueryHub. Reports the peak RSS growth per row.
+'''
+
+import sys
+sys.path.append(".")
+sys.path.append("..")
+
+import gatelogic
+import resource
+
+
+def rss():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def action(row, toggle_hub):
+    if toggle_hub.get('enabled').value != 'True':
+        return None
+    return row.value
+
+
+def build(n):
+    c = gatelogic.Controller()
+    signals = gatelogic.ReadableHub(c)
+    toggle_hub = gatelogic.QueryHub(c)
+    mitigations = gatelogic.ComputableHub(c)
+
+    def on_new(_, kind, k, row):
+        if kind == 'add':
+            mitigations.maintain(k, action, row, toggle_hub)
+    c.subscribe(signals, on_new)
+
+    signals.update(dict((i, 'example%d.com' % i) for i in xrange(n)))
+    toggle_hub.update({'enabled': 'True'})
+    return c, signals, mitigations
+
+
+def main(n):
+    base = rss()
+    data = build(n)
+    used = rss() - base
+    print "cells:           %d" % (n,)
+    print "rss growth:      %.1f MiB" % (used / 1048576.,)
+    print "bytes per row:   %d" % (used / n,)
+    return data
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
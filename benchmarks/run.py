@@ -0,0 +1,152 @@
+'''
+Benchmark runner. To run:
+
+    ./venv/bin/python benchmarks/run.py [--scale 1.0] [--save] [scenario ...]
+
+Runs every scenario from scenarios.py in its own process, so that the
+peak RSS is its own, and prints ops/sec and peak RSS next to the
+results tracked in results.json. Exits with 1 if any scenario got
+slower, or bigger, than --tolerance. --save records the new results.
+
+Results drift a little with every save, so results.json also keeps a
+baseline: the results of the tree before the controller was reworked,
+measured on the same machine. Scenarios slower than the baseline fail
+as well. To measure it again, with that tree checked out elsewhere:
+
+    ./venv/bin/python benchmarks/run.py --tree ../gatelogic-baseline --save-baseline
+
+Scenarios using what the baseline tree lacks are left out of it.
+'''
+
+import json
+import optparse
+import os
+import resource
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+RESULTS = os.path.join(HERE, 'results.json')
+
+
+def child(name, scale, tree):
+    if tree:
+        sys.path.insert(0, os.path.abspath(tree))
+    import scenarios
+    result = scenarios.SCENARIOS[name](scale)
+    result['ops_per_sec'] = result['ops'] / result['seconds']
+    # ru_maxrss is in kilobytes on Linux
+    result['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print json.dumps(result)
+
+
+def run(name, scale, tree=None):
+    args = [sys.executable, os.path.abspath(__file__),
+            '--child', name, '--scale', str(scale)]
+    if tree:
+        args += ['--tree', tree]
+    out = subprocess.check_output(args)
+    return json.loads(out.strip().split('\n')[-1])
+
+
+def change(result, old):
+    # Relative speed and size changes, positive when faster or bigger.
+    return (result['ops_per_sec'] / old['ops_per_sec'] - 1,
+            float(result['peak_rss']) / old['peak_rss'] - 1)
+
+
+def save_baseline(names, scale, tree):
+    tracked = {}
+    if os.path.exists(RESULTS):
+        with open(RESULTS, 'rb') as fd:
+            tracked = json.load(fd)
+    baseline = {'scale': scale, 'scenarios': {}}
+    for name in names:
+        try:
+            result = run(name, scale, tree)
+        except subprocess.CalledProcessError:
+            print "%-16s %14s" % (name, 'unsupported')
+            continue
+        print "%-16s %14.0f" % (name, result['ops_per_sec'])
+        baseline['scenarios'][name] = result
+    tracked['baseline'] = baseline
+    with open(RESULTS, 'wb') as fd:
+        json.dump(tracked, fd, indent=2, sort_keys=True)
+        fd.write('\n')
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] [scenario ...]')
+    parser.add_option('--scale', type='float', default=1.0,
+                      help='size of the graphs, relative to the default')
+    parser.add_option('--tolerance', type='float', default=0.2,
+                      help='allowed regression, relative')
+    parser.add_option('--save', action='store_true',
+                      help='record the results in results.json')
+    parser.add_option('--tree',
+                      help='benchmark the gatelogic package in this tree')
+    parser.add_option('--save-baseline', action='store_true',
+                      help='record the results as the baseline')
+    parser.add_option('--child', help=optparse.SUPPRESS_HELP)
+    opts, names = parser.parse_args()
+
+    if opts.child:
+        child(opts.child, opts.scale, opts.tree)
+        return 0
+
+    import scenarios
+    names = names or list(scenarios.SCENARIOS)
+    if opts.save_baseline:
+        save_baseline(names, opts.scale, opts.tree)
+        return 0
+
+    tracked = {}
+    if os.path.exists(RESULTS):
+        with open(RESULTS, 'rb') as fd:
+            tracked = json.load(fd)
+    if tracked.get('scale', opts.scale) != opts.scale:
+        print "results.json is for scale %s, not comparing" % (tracked['scale'],)
+        tracked = {}
+    tracked.setdefault('scale', opts.scale)
+    tracked.setdefault('scenarios', {})
+    baseline = {}
+    if tracked.get('baseline', {}).get('scale') == opts.scale:
+        baseline = tracked['baseline']['scenarios']
+
+    print "%-16s %14s %9s %9s %12s %9s" % (
+        'scenario', 'ops/sec', '', 'baseline', 'peak RSS', '')
+    failed = False
+    for name in names:
+        result = run(name, opts.scale, opts.tree)
+        old = tracked['scenarios'].get(name)
+        speed = rss = vs_baseline = ''
+        if old:
+            speed, rss = change(result, old)
+            if speed < -opts.tolerance or rss > opts.tolerance:
+                failed = True
+            speed, rss = '%+.0f%%' % (speed * 100,), '%+.0f%%' % (rss * 100,)
+        if name in baseline:
+            vs_baseline, _ = change(result, baseline[name])
+            if vs_baseline < -opts.tolerance:
+                failed = True
+            vs_baseline = '%+.0f%%' % (vs_baseline * 100,)
+        print "%-16s %14.0f %9s %9s %10.1fMiB %9s" % (
+            name, result['ops_per_sec'], speed, vs_baseline,
+            result['peak_rss'] / 1048576., rss)
+        for key in sorted(result):
+            if key not in ('ops', 'seconds', 'ops_per_sec', 'peak_rss'):
+                print "    %s: %s" % (key, result[key])
+        tracked['scenarios'][name] = result
+
+    if opts.save:
+        with open(RESULTS, 'wb') as fd:
+            json.dump(tracked, fd, indent=2, sort_keys=True)
+            fd.write('\n')
+    return 1 if failed and not opts.save else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+'''
+Benchmark scenarios, run by run.py.
+
+Every scenario takes a ``scale`` factor, builds its graph untimed and
+returns a dictionary with the number of timed ``ops`` and the
+``seconds`` they took, plus any extra numbers worth tracking. Graphs
+are built with what the baseline tree has too, see run.py.
+'''
+
+import collections
+import time
+
+import gatelogic
+
+import memory
+
+
+SCENARIOS = collections.OrderedDict()
+
+
+def scenario(fun):
+    SCENARIOS[fun.__name__] = fun
+    return fun
+
+
+def timed(fun, *args):
+    t0 = time.time()
+    fun(*args)
+    return time.time() - t0
+
+
+@scenario
+def fanout(scale):
+    ''' One toggle read by 100k ComputedCells, flipped 10 times. '''
+    n = int(100000 * scale)
+    c = gatelogic.Controller()
+    toggle_hub = gatelogic.QueryHub(c)
+    mitigations = gatelogic.ComputableHub(c)
+
+    def action(i):
+        if toggle_hub.get('enabled').value != 'True':
+            return None
+        return i
+
+    for i in xrange(n):
+        mitigations.maintain(i, action, i)
+
+    def flip(times):
+        for i in xrange(times):
+            toggle_hub.update({'enabled': 'True' if i % 2 == 0 else 'False'})
+    return {'ops': 10 * n, 'seconds': timed(flip, 10)}
+
+
+@scenario
+def chain(scale):
+    ''' A chain of 10k ComputedCells, its input changed 10 times. '''
+    n = int(10000 * scale)
+    c = gatelogic.Controller()
+    hub = gatelogic.ReadableHub(c)
+    chain = gatelogic.ComputableHub(c)
+    hub.update({'x': 0})
+
+    def action(i):
+        if i == 0:
+            return hub.get('x').value
+        return chain.get(i - 1).value + 1
+
+    for i in xrange(n):
+        chain.maintain(i, action, i)
+
+    def change(times):
+        for i in xrange(times):
+            hub.update({'x': i + 1})
+    return {'ops': 10 * n, 'seconds': timed(change, 10)}
+
+
+@scenario
+def query_churn(scale):
+    ''' 10k ComputedCells moving between QueryHub keys, so that keys
+    are created and dropped through _on_lost_reference. '''
+    n = int(10000 * scale)
+    c = gatelogic.Controller()
+    shift_hub = gatelogic.QueryHub(c)
+    query_hub = gatelogic.QueryHub(c)
+    mitigations = gatelogic.ComputableHub(c)
+
+    def action(i):
+        return query_hub.get(i + (shift_hub.get('shift').value or 0)).value
+
+    for i in xrange(n):
+        mitigations.maintain(i, action, i)
+
+    def shift(times):
+        for i in xrange(times):
+            shift_hub.update({'shift': (i + 1) * n})
+    return {'ops': 10 * n, 'seconds': timed(shift, 10)}
+
+
+@scenario
+def snapshot_delta(scale):
+    ''' A ReadableHub of 100k rows, 10 rows changing per update, as
+    full snapshots and as deltas. '''
+    n = int(100000 * scale)
+    c = gatelogic.Controller()
+    hub = gatelogic.ReadableHub(c)
+    data = dict((i, i) for i in xrange(n))
+    hub.update(data)
+
+    def snapshots(times):
+        for i in xrange(times):
+            for k in xrange(10):
+                data[k] = i
+            hub.update(data)
+
+    def deltas(times):
+        for i in xrange(times):
+            hub.apply_delta(changed=dict((k, -i) for k in xrange(10)))
+
+    return {'ops': 10 * 100, 'seconds': timed(deltas, 100),
+            'snapshot_seconds': timed(snapshots, 10)}
+
+
+@scenario
+def memory_per_cell(scale):
+    ''' Bytes of RSS per row of memory.py's graph, 200k rows. '''
+    n = int(200000 * scale)
+    base = memory.rss()
+    t0 = time.time()
+    graph = memory.build(n)
+    seconds = time.time() - t0
+    used = memory.rss() - base
+    del graph
+    return {'ops': n, 'seconds': seconds, 'bytes_per_cell': used / n}
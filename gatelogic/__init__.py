@@ -1,3 +1,9 @@
-
-from .xcontroller import Cell, ComputedCell, Controller
-from .hub import ComputableHub, ReadableHub, QueryHub
+from .xcontroller import Cell, ComputedCell, LazyComputedCell, Controller
+from .hub import ComputableHub, LazyComputableHub, ReadableHub, QueryHub
+from .loop import EventLoop
+from .sink import ChangeSet, Changefeed, Sink
+from .files import FileComputableHub, FileQueryHub, FileReadableHub
+from .stats import Stats
+from . import graph
+from .shard import ShardedComputableHub
+from .aggregate import Aggregate, Count, Max, Min, Reducer, Sum
@@ -0,0 +1,173 @@
+import bisect
+
+from .xcontroller import Cell, ComputedCell, _missing
+
+
+class Reducer(object):
+    """ Folds values into a state with ``add(state, value)`` and takes
+    them out again with ``remove(state, value)``, both returning the new
+    state. ``result(state)`` is the aggregated value, the state itself
+    unless overridden, so keep the state immutable then. """
+
+    def __init__(self, add, remove, initial=None):
+        self._add = add
+        self._remove = remove
+        self._initial = initial
+
+    def initial(self):
+        return self._initial
+
+    def add(self, state, value):
+        return self._add(state, value)
+
+    def remove(self, state, value):
+        return self._remove(state, value)
+
+    def result(self, state):
+        return state
+
+
+class Count(Reducer):
+    """ Number of values. """
+    def __init__(self):
+        pass
+
+    def initial(self):
+        return 0
+
+    def add(self, state, value):
+        return state + 1
+
+    def remove(self, state, value):
+        return state - 1
+
+
+class Sum(Count):
+    """ Sum of the values. """
+    def add(self, state, value):
+        return state + value
+
+    def remove(self, state, value):
+        return state - value
+
+
+class Min(Reducer):
+    """ Smallest value, None when there are none. Values are kept
+    sorted, found by bisection. """
+    _end = 0
+
+    def __init__(self):
+        pass
+
+    def initial(self):
+        return []
+
+    def add(self, state, value):
+        bisect.insort(state, value)
+        return state
+
+    def remove(self, state, value):
+        del state[bisect.bisect_left(state, value)]
+        return state
+
+    def result(self, state):
+        return state[self._end] if state else None
+
+
+class Max(Min):
+    """ Largest value, None when there are none. """
+    _end = -1
+
+
+class Aggregate(object):
+    """ Keeps the values of ``hub`` aggregated by ``reducer``, updated
+    on every add, delete or set event of the hub instead of scanning it.
+
+    ``value(key, value)`` picks what is aggregated from an entry, the
+    value itself by default. With ``group(key, value)`` entries are
+    aggregated per group, None leaves an entry out. ``get(group)``
+    returns a Cell holding the result for the group, a computation
+    reading it depends on that group only. """
+
+    def __init__(self, hub, reducer, group=None, value=None):
+        self._hub = hub
+        self._controller = hub._controller
+        self._reducer = reducer
+        self._group = group
+        self._value = value
+        # key -> (group, aggregated value)
+        self._rows = {}
+        # group -> [state, entries, Cell]
+        self._groups = {}
+
+        with self._controller._w( (None, 'update'), 'update'):
+            for key, cell in hub._ns.items():
+                self._on_event(hub, 'add', key, cell)
+        self._controller.subscribe(hub, self._on_event)
+
+    def _on_event(self, _hub, kind, key, cell):
+        old = self._rows.pop(key, _missing)
+        if old is not _missing:
+            group, value = old
+            entry = self._groups[group]
+            entry[0] = self._reducer.remove(entry[0], value)
+            entry[1] -= 1
+            self._publish(group, entry)
+
+        if kind == 'delete':
+            return
+        if kind == 'add' and isinstance(cell, ComputedCell) and \
+                cell._verified is None:
+            # Not computed yet, added by its first 'set'.
+            return
+        value = cell._value
+        group = None
+        if self._group is not None:
+            group = self._group(key, value)
+            if group is None:
+                return
+        if self._value is not None:
+            value = self._value(key, value)
+        self._rows[key] = (group, value)
+        entry = self._entry(group)
+        entry[0] = self._reducer.add(entry[0], value)
+        entry[1] += 1
+        self._publish(group, entry)
+
+    def _entry(self, group):
+        entry = self._groups.get(group)
+        if entry is None:
+            cell = Cell(self._controller)
+            entry = self._groups[group] = [self._reducer.initial(), 0, cell]
+            cell._value = self._reducer.result(entry[0])
+            def fun():
+                if not entry[1] and not self._controller._refcount(cell) \
+                        and self._groups.get(group) is entry:
+                    del self._groups[group]
+            cell._on_lost_reference = fun
+        return entry
+
+    def _publish(self, group, entry):
+        state, count, cell = entry
+        value = self._reducer.result(state)
+        if cell._value != value:
+            # QueryHub keys are also created from within computations.
+            self._controller._set_internal(cell, value)
+        if not count and not self._controller._refcount(cell):
+            del self._groups[group]
+
+    def get(self, group=None):
+        """ Cell holding the result for ``group``. """
+        # computations may run in parallel
+        with self._controller._lock:
+            return self._entry(group)[2]
+
+    def dump(self):
+        """ Return ``{group: result}`` of the groups with entries. """
+        return dict((group, self._reducer.result(entry[0]))
+                    for group, entry in self._groups.iteritems()
+                    if entry[1])
+
+    def close(self):
+        """ Stop following the hub. """
+        self._controller.unsubscribe(self._hub, self._on_event)
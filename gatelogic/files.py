@@ -0,0 +1,162 @@
+'''
+Hubs backed by flat files of ``key value`` lines.
+
+A file is either a snapshot, rewritten as a whole, or an append-only
+log, where a ``key value`` line sets a key and a bare ``key`` line
+deletes it. Inputs are re-read only when their mtime, inode or size
+change, and a log is read from where the last poll stopped. Snapshots
+are written atomically through a temporary file; logs get only the
+changed lines appended.
+'''
+
+import mmap
+import os
+import tempfile
+
+from .hub import ComputableHub, QueryHub, ReadableHub
+from .sink import Sink
+
+
+def _parse(line):
+    # 'key value' sets, a bare 'key' deletes
+    if ' ' in line:
+        k, v = line.split(' ', 1)
+        return 'set', k, v
+    return 'delete', line, None
+
+
+class _FileReader(object):
+    def __init__(self, fname, log):
+        self.fname = fname
+        self.log = log
+        self._stat = None
+        self._offset = 0
+
+    def read(self):
+        """ Return None when the file didn't change, otherwise a pair
+        ``(full, data)``: a snapshot dictionary when ``full``, or a list
+        of new ``(kind, key, value)`` changes from the log. """
+        try:
+            st = os.stat(self.fname)
+        except OSError:
+            st = None
+        stat = st and (st.st_ino, st.st_size, st.st_mtime)
+        if stat == self._stat:
+            return None
+
+        # A rotated or truncated log is replayed from the start.
+        full = (not self.log or self._stat is None or st is None or
+                st.st_ino != self._stat[0] or st.st_size < self._offset)
+        self._stat = stat
+        if full:
+            self._offset = 0
+        if st is None or st.st_size == self._offset:
+            return full, ({} if full else [])
+
+        with open(self.fname, 'rb') as fd:
+            m = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            m.seek(self._offset)
+            changes = []
+            while True:
+                line = m.readline()
+                if not line:
+                    break
+                if not line.endswith('\n'):
+                    if self.log:
+                        # Not completely written yet, pick it up next
+                        # time.
+                        break
+                    line += '\n'
+                self._offset += len(line)
+                line = line[:-1]
+                if line:
+                    changes.append(_parse(line))
+        finally:
+            m.close()
+
+        if not full:
+            return False, changes
+
+        data = {}
+        for kind, k, v in changes:
+            if kind == 'delete':
+                data.pop(k, None)
+            else:
+                data[k] = v
+        if not self.log:
+            # A snapshot is always read whole.
+            self._offset = 0
+        return True, data
+
+
+class _FileWriter(object):
+    def __init__(self, hub, fname, log, **kwargs):
+        self.fname = fname
+        self.log = log
+        self.sink = Sink(hub, self.write, mode='delta' if log else 'snapshot',
+                         **kwargs)
+
+    def write(self, data):
+        if self.log:
+            with open(self.fname, 'ab') as fd:
+                fd.write(''.join(
+                    ('%s\n' % (k,)) if kind == 'delete' else ('%s %s\n' % (k, v))
+                    for kind, k, v in data))
+            return
+
+        dirname = os.path.dirname(os.path.abspath(self.fname))
+        fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(''.join('%s %s\n' % (k, data[k]) for k in sorted(data)))
+            os.rename(tmp, self.fname)
+        except:
+            os.unlink(tmp)
+            raise
+
+
+class FileReadableHub(ReadableHub):
+    """ A ReadableHub following the file ``fname``, updated on
+    ``poll()``. """
+    def __init__(self, controller, fname, log=False, ttl=None):
+        ReadableHub.__init__(self, controller, ttl)
+        self._reader = _FileReader(fname, log)
+
+    def poll(self):
+        """ Read the file if it changed. """
+        read = self._reader.read()
+        if read is not None:
+            full, data = read
+            if full:
+                self.update(data)
+            elif data:
+                self.patch(data)
+
+
+class FileQueryHub(QueryHub):
+    """ A QueryHub writing requested keys to ``req_fname`` and reading
+    responses from ``res_fname`` on ``poll()``. """
+    def __init__(self, controller, req_fname, res_fname, log=False, retain=0,
+                 **kwargs):
+        QueryHub.__init__(self, controller, retain)
+        self._reader = _FileReader(res_fname, log)
+        self._writer = _FileWriter(self, req_fname, log, **kwargs)
+
+    def poll(self):
+        """ Read the responses if they changed. """
+        read = self._reader.read()
+        if read is not None:
+            full, data = read
+            if full:
+                self.update(data)
+            elif data:
+                self.patch(data)
+
+
+class FileComputableHub(ComputableHub):
+    """ A ComputableHub written out to ``fname``. Extra keyword
+    arguments are passed to its Sink. """
+    def __init__(self, controller, fname, log=False, **kwargs):
+        ComputableHub.__init__(self, controller)
+        self._writer = _FileWriter(self, fname, log, **kwargs)
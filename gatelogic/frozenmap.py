@@ -0,0 +1,78 @@
+import collections
+
+
+class FrozenMap(collections.Mapping):
+    """ An immutable mapping with a ``version``.
+
+    Keys are spread over a number of buckets. ``evolve()`` returns a
+    new version that shares every untouched bucket with the old one, so
+    deriving a version costs the number of buckets plus the size of the
+    touched ones. Values are never copied, treat them as immutable. """
+
+    _min_width = 16
+
+    def __init__(self, data=(), version=0):
+        if not isinstance(data, dict):
+            data = dict(data)
+        width = self._min_width
+        while width * width < len(data):
+            width *= 2
+        buckets = [{} for _ in xrange(width)]
+        mask = width - 1
+        for k, v in data.iteritems():
+            buckets[hash(k) & mask][k] = v
+        self._buckets = buckets
+        self._mask = mask
+        self._len = len(data)
+        self.version = version
+
+    def __getitem__(self, key):
+        return self._buckets[hash(key) & self._mask][key]
+
+    def __contains__(self, key):
+        return key in self._buckets[hash(key) & self._mask]
+
+    def __iter__(self):
+        for bucket in self._buckets:
+            for k in bucket:
+                yield k
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return "%s(%r, version=%r)" % (self.__class__.__name__,
+                                       dict(self.iteritems()), self.version)
+
+    def evolve(self, changes):
+        """ Return the next version with ``changes`` applied. Changes
+        are ``(kind, key, value)`` tuples, 'delete' removes the key,
+        anything else sets it. """
+        buckets = list(self._buckets)
+        mask = self._mask
+        copied = set()
+        length = self._len
+        for kind, k, v in changes:
+            i = hash(k) & mask
+            if i not in copied:
+                buckets[i] = dict(buckets[i])
+                copied.add(i)
+            bucket = buckets[i]
+            if kind == 'delete':
+                if k in bucket:
+                    del bucket[k]
+                    length -= 1
+            else:
+                if k not in bucket:
+                    length += 1
+                bucket[k] = v
+
+        new = FrozenMap.__new__(self.__class__)
+        new._buckets = buckets
+        new._mask = mask
+        new._len = length
+        new.version = self.version + 1
+        if length > 4 * len(buckets) * len(buckets):
+            # Grown out of the bucket count, rebalance.
+            return self.__class__(new.iteritems(), new.version)
+        return new
@@ -0,0 +1,135 @@
+'''
+Analysis and export of a Controller's dependency graph, as seen
+through ``Controller.nodes()`` and ``Controller.edges()``.
+
+Everything here walks the live graph, don't change it meanwhile. The
+exports are generators, so that graphs with millions of edges can be
+written out without building them in memory.
+'''
+
+import collections
+import json
+
+from .xcontroller import Cell, ComputedCell, _node
+
+
+def node_id(node):
+    """ Stable identifier of a node, for the exports. """
+    if isinstance(node, Cell):
+        return 'c%d' % (node._id,)
+    return 'o%x' % (id(node),)
+
+
+def describe(node):
+    """ Human readable name of a node. """
+    if isinstance(node, ComputedCell):
+        fun = node._fun[0]
+        return '%s#%d' % (getattr(fun, '__name__', repr(fun)), node._id)
+    if isinstance(node, Cell):
+        return '%s#%d' % (node.__class__.__name__, node._id)
+    name = getattr(node, '__name__', None)
+    if name is None:
+        name = node.__class__.__name__
+    return name
+
+
+def degrees(controller):
+    """ Return two dictionaries, fan-in and fan-out: the number of
+    objects every node reads and is read by. """
+    fan_in = collections.defaultdict(int)
+    fan_out = collections.defaultdict(int)
+    for obj, subscriber, _ in controller.edges():
+        fan_out[obj] += 1
+        fan_in[subscriber] += 1
+    return dict(fan_in), dict(fan_out)
+
+
+def distribution(controller):
+    """ Return ``(fan_in, fan_out)`` histograms, mapping a degree to
+    the number of nodes having it. Nodes without edges in a direction
+    count as degree 0. """
+    fan_in, fan_out = degrees(controller)
+    hists = (collections.defaultdict(int), collections.defaultdict(int))
+    for node in controller.nodes():
+        hists[0][fan_in.get(node, 0)] += 1
+        hists[1][fan_out.get(node, 0)] += 1
+    return dict(hists[0]), dict(hists[1])
+
+
+def downstream(controller, obj):
+    """ Return the set of nodes a change of ``obj`` may reach. """
+    links = controller._links
+    seen = set()
+    stack = [obj]
+    while stack:
+        for entry in links.get(stack.pop(), ()):
+            if type(entry) is tuple:
+                entry = entry[0]
+            node = _node(entry)
+            if node not in seen:
+                seen.add(node)
+                stack.append(node)
+    seen.discard(obj)
+    return seen
+
+
+def largest_closures(controller, n=10, candidates=100):
+    """ Return the ``n`` nodes with the largest transitive downstream
+    closure, as ``(size, node)`` pairs, largest first.
+
+    A closure can cost the whole graph to walk, so only the
+    ``candidates`` nodes with the highest fan-out are walked. None walks
+    every node. """
+    _, fan_out = degrees(controller)
+    nodes = sorted(fan_out, key=fan_out.get, reverse=True)
+    if candidates is not None:
+        nodes = nodes[:candidates]
+    sizes = [(len(downstream(controller, node)), node) for node in nodes]
+    sizes.sort(key=lambda item: item[0], reverse=True)
+    return sizes[:n]
+
+
+def _edge_label(args):
+    return ' '.join(str(arg) for arg in args)
+
+
+def to_dot(controller, name='gatelogic'):
+    """ Generate the graph in Graphviz DOT format, line by line. """
+    yield 'digraph %s {\n' % (json.dumps(name),)
+    for node in controller.nodes():
+        shape = 'box' if not isinstance(node, Cell) else 'ellipse'
+        yield '  %s [label=%s, shape=%s];\n' % (
+            node_id(node), json.dumps(describe(node)), shape)
+    for obj, subscriber, args in controller.edges():
+        if args:
+            yield '  %s -> %s [label=%s];\n' % (
+                node_id(obj), node_id(subscriber),
+                json.dumps(_edge_label(args)))
+        else:
+            yield '  %s -> %s;\n' % (node_id(obj), node_id(subscriber))
+    yield '}\n'
+
+
+def to_json(controller):
+    """ Generate the graph as a JSON object ``{"nodes": [{"id", "label"},
+    ...], "edges": [[from, to, label], ...]}``, in chunks. """
+    yield '{"nodes": ['
+    sep = '\n'
+    for node in controller.nodes():
+        yield sep + json.dumps({'id': node_id(node), 'label': describe(node)})
+        sep = ',\n'
+    yield '\n], "edges": ['
+    sep = '\n'
+    for obj, subscriber, args in controller.edges():
+        yield sep + json.dumps([node_id(obj), node_id(subscriber),
+                                _edge_label(args)])
+        sep = ',\n'
+    yield '\n]}\n'
+
+
+def write(controller, fd, format='dot'):
+    """ Write the graph to the file object ``fd``, as 'dot' or
+    'json'. """
+    chunks = to_dot(controller) if format == 'dot' else to_json(controller)
+    for chunk in chunks:
+        fd.write(chunk)
@@ -1,9 +1,43 @@
+import bisect
+import collections
+import contextlib
 import copy
+import sys
+import time
 
-from .xcontroller import Cell, ComputedCell
+from .frozenmap import FrozenMap
+from .xcontroller import Cell, ComputedCell, LazyComputedCell, _missing
+
+
+class _Slice(Cell):
+    """ Part of a hub, selected by an index or a key range. Its value
+    counts the changes to that part, a computation reading the part
+    depends on this cell only. """
+    __slots__ = ('keys',)
+
+    def __init__(self, controller):
+        Cell.__init__(self, controller, 0)
+        self.keys = set()
+
+    def _touch(self):
+        self._controller._set_internal(self, self._value + 1)
+
+
+def _value(cell):
+    # _missing for ComputedCells not computed yet.
+    if isinstance(cell, ComputedCell) and cell._verified is None:
+        return _missing
+    return cell._value
 
 
 class _GenericHub(object):
+    # name -> (fun, {index key: _Slice}, {key: index key})
+    _indexes = None
+    # Keys in order, built by the first range() call.
+    _sorted = None
+    # See set_priority()
+    _priority = 0
+
     def __init__(self, controller):
         self.extra = {}
         self._ns = {}
@@ -15,11 +49,22 @@ class _GenericHub(object):
     def has_key(self, key):
         return key in self._ns
 
-    def _add(self, key, cell):
+    def _add(self, key, cell, run=True):
         self._ns[key] = cell
+        if self._priority:
+            self._controller.set_priority(cell, self._priority)
         if isinstance(cell, ComputedCell):
-            cell._first_run()
+            if self._controller._restored and \
+                    self._controller._restore(self, key, cell):
+                pass
+            elif run:
+                cell._first_run()
+            elif not cell._lazy:
+                # computed with the rest of the propagation wave
+                self._controller._enqueue(cell)
         self._controller.subscribe(cell, self._on_change, key)
+        if self._indexes or self._sorted is not None:
+            self._reindex('add', key, _value(cell))
         self._controller._dirty(self, 'add', key, cell)
         return cell
 
@@ -27,79 +72,381 @@ class _GenericHub(object):
         cell = self._ns[key]
         del self._ns[key]
         self._controller.unsubscribe(cell, self._on_change, key)
+        if self._indexes or self._sorted is not None:
+            self._reindex('delete', key, None)
         self._controller._dirty(self, 'delete', key, None)
 
+    def _reindex(self, kind, key, value):
+        # Move ``key`` between index slices, notify the readers of the
+        # slices and ranges it leaves or enters. Cells not computed yet
+        # are indexed on their first 'set'.
+        indexes = self._indexes if value is not _missing else None
+        for fun, slices, of in (indexes or {}).itervalues():
+            old = of.pop(key, None)
+            new = None if kind == 'delete' else fun(key, value)
+            if old is not None and old != new:
+                part = slices[old]
+                part.keys.discard(key)
+                part._touch()
+                if not part.keys and not self._controller._refcount(part):
+                    del slices[old]
+            if new is not None:
+                of[key] = new
+                part = slices.get(new)
+                if part is None:
+                    part = slices[new] = self._slice(slices, new)
+                part.keys.add(key)
+                part._touch()
+
+        if self._sorted is not None:
+            if kind == 'add':
+                bisect.insort(self._sorted, key)
+            elif kind == 'delete':
+                del self._sorted[bisect.bisect_left(self._sorted, key)]
+            for (lo, hi), part in self._ranges.items():
+                if (lo is None or lo <= key) and (hi is None or key < hi):
+                    part._touch()
+
+    def _slice(self, slices, skey):
+        part = _Slice(self._controller)
+        def fun():
+            if not part.keys and not self._controller._refcount(part) \
+                    and slices.get(skey) is part:
+                del slices[skey]
+        part._on_lost_reference = fun
+        return part
+
+    def _read_slice(self, slices, skey):
+        # The slice to depend on, created for the computation reading
+        # it. None outside of computations.
+        part = slices.get(skey)
+        if part is None and self._controller.cycle == 'running':
+            # computations may run in parallel
+            with self._controller._lock:
+                part = slices.get(skey)
+                if part is None:
+                    part = slices[skey] = self._slice(slices, skey)
+        if part is not None:
+            self._controller._register_read(part)
+        return part
+
+    def set_priority(self, priority):
+        """ Give the cells of the hub, present and future, the
+        ``priority``: changes of an input hub and recomputations of a
+        ComputableHub are propagated before the ones of lower priority.
+        See ``Controller.set_priority()``. """
+        self._priority = priority
+        for cell in self._ns.itervalues():
+            self._controller.set_priority(cell, priority)
+
+    def add_index(self, name, fun):
+        """ Declare the secondary index ``name``. ``fun(key, value)``
+        returns the index key of an entry, None leaves it out. """
+        if self._indexes is None:
+            self._indexes = {}
+        if name in self._indexes:
+            raise KeyError(name)
+        slices, of = {}, {}
+        self._indexes[name] = (fun, slices, of)
+        for key, cell in self._ns.iteritems():
+            value = _value(cell)
+            ikey = None if value is _missing else fun(key, value)
+            if ikey is not None:
+                of[key] = ikey
+                part = slices.get(ikey)
+                if part is None:
+                    part = slices[ikey] = self._slice(slices, ikey)
+                part.keys.add(key)
+
+    def lookup(self, name, ikey):
+        """ Return ``{key: value}`` of the entries with the index key
+        ``ikey`` in the index ``name``. A computation calling it depends
+        on that part of the index, not on every cell in it. """
+        part = self._read_slice(self._indexes[name][1], ikey)
+        if part is None:
+            return {}
+        return dict((k, self._ns[k]._value) for k in part.keys)
+
+    def range(self, lo=None, hi=None):
+        """ Return ``[(key, value)]`` for the keys from ``lo`` included
+        to ``hi`` excluded, in key order. None leaves a side open. A
+        computation calling it depends on the range only. """
+        if self._sorted is None:
+            with self._controller._lock:
+                if self._sorted is None:
+                    self._ranges = {}
+                    self._sorted = sorted(self._ns)
+        self._read_slice(self._ranges, (lo, hi))
+        keys = self._sorted
+        i = 0 if lo is None else bisect.bisect_left(keys, lo)
+        j = len(keys) if hi is None else bisect.bisect_left(keys, hi)
+        return [(k, self._ns[k]._value) for k in keys[i:j]]
+
+    def prefix(self, prefix):
+        """ Return ``[(key, value)]`` for the string keys starting with
+        ``prefix``, in key order, like ``range()``. """
+        if isinstance(prefix, unicode):
+            top, succ = unichr(sys.maxunicode), unichr
+        else:
+            top, succ = '\xff', chr
+        hi = prefix.rstrip(top)
+        hi = hi[:-1] + succ(ord(hi[-1]) + 1) if hi else None
+        return self.range(prefix, hi)
+
+    def _set_extra(self, extra):
+        # Comparing is cheaper than copying, and extra rarely changes.
+        if extra != self.extra:
+            self.extra = copy.deepcopy(extra)
+
     def _update(self, data, partial, extra):
-        self.extra = copy.deepcopy(extra)
+        self._set_extra(extra)
 
-        read = dict(data)
-        old = set(self._ns.iterkeys())
-        new = set(read.iterkeys())
+        read = data if isinstance(data, dict) else dict(data)
+        self._patch(self._diff(read, partial), partial)
 
-        # 0) if changed, update
-        for k in old & new:
-            # it is possible that during update of previus cell an _ns
-            # item was removed.
-            if k in self._ns and self._ns[k].value != read[k]:
-                self._ns[k].value = read[k]
+    def _diff(self, read, partial):
+        # Changes turning the hub into ``read``, as (kind, key, value).
+        for k, v in read.iteritems():
+            yield ('set' if k in self._ns else 'add'), k, v
 
         if partial:
             return
 
-        # 1) we do care about extra data
-        for k in new - old:
-            if k not in self._ns:
-                cell = Cell(self._controller)
-                cell.value = read[k]
-                self._add(k, cell)
-            else:
-                self._ns[k].value = read[k]
+        for k in [k for k in self._ns if k not in read]:
+            yield 'delete', k, None
 
-        # 2) delete the deleted stuff
-        for k in old - new:
-            if k in self._ns:
-                self._delete(k)
+    def _delta(self, added, changed, removed):
+        for k, v in (added or {}).iteritems():
+            yield 'add', k, v
+        for k, v in (changed or {}).iteritems():
+            yield 'set', k, v
+        for k in removed or ():
+            yield 'delete', k, None
+
+    def _patch(self, changes, partial):
+        # Apply (kind, key, value) changes. In ``partial`` mode only
+        # the cells already present are modified.
+        for kind, k, v in changes:
+            assert kind in ('add', 'delete', 'set'), kind
+            # it is possible that during update of previus cell an _ns
+            # item was removed.
+            if kind == 'delete':
+                if not partial and k in self._ns:
+                    self._delete(k)
+            elif k in self._ns:
+                if self._ns[k].value != v:
+                    self._ns[k].value = v
+            elif not partial:
+                self._add(k, Cell(self._controller, v))
 
     def _on_change(self, obj, kind, _key, value, key):
         # Value of a cell was modified.
         # TODO: maybe fill key in this message
         assert kind in ('set',)
+        if self._indexes or self._sorted is not None:
+            self._reindex('set', key, value)
         self._controller._dirty(self, kind, key, obj)
 
     def dump(self):
         return dict((k, v._value) for k, v in self._ns.iteritems())
 
+    def _save(self, names):
+        # State for Controller.snapshot(), ``names`` maps cells to their
+        # (hub name, key).
+        values, computed = {}, {}
+        rev_links = self._controller._rev_links
+        for key, cell in self._ns.iteritems():
+            if not isinstance(cell, ComputedCell):
+                values[key] = cell._value
+                continue
+            if cell._verified is None or cell._inputs_changed():
+                # Never computed or stale, lazy cells can be.
+                continue
+            inputs = []
+            for obj in rev_links.get(cell, ()):
+                if obj not in names:
+                    break
+                name, k = names[obj]
+                inputs.append((name, k, obj._value))
+            else:
+                fun = cell._fun[0]
+                computed[key] = (getattr(fun, '__name__', None),
+                                 cell._value, inputs)
+        return {'extra': self.extra, 'values': values, 'computed': computed}
+
+    def _load(self, state, hubs):
+        # Counterpart of _save(), called by Controller.restore().
+        self._set_extra(state['extra'])
+        restored = self._controller._restored
+        for key, (name, value, inputs) in state['computed'].iteritems():
+            if all(hub_name in hubs for hub_name, _, _ in inputs):
+                restored[self, key] = (name, value, [
+                    (hubs[hub_name], k, v) for hub_name, k, v in inputs])
+
+    def _peek(self, key):
+        # Current value of ``key`` as an input of a restored cell.
+        cell = self._ns.get(key)
+        if cell is None:
+            return _missing
+        if isinstance(cell, ComputedCell) and cell._lazy:
+            cell._refresh()
+        return cell._value
+
+    def _input(self, key):
+        return self._ns[key]
+
+    @contextlib.contextmanager
+    def _updating(self):
+        # An update from outside, propagated when the block exits.
+        stats = self._controller._stats
+        if stats is not None:
+            t0 = time.time()
+        with self._controller.batch():
+            with self._controller._w( (None,), 'update'):
+                yield
+        if stats is not None:
+            stats.on_hub_update(self, time.time() - t0)
+
 
 class ReadableHub(_GenericHub):
+    def __init__(self, controller, ttl=None):
+        """ With ``ttl``, keys not set by an update for ``ttl`` seconds
+        are deleted, see ``Controller.run_timers()``. """
+        _GenericHub.__init__(self, controller)
+        self._ttl = ttl
+        # key -> time it expires, None once deleted while its timer
+        # is still due
+        self._expires = {}
+
+    def _patch(self, changes, partial):
+        if self._ttl is not None:
+            changes = self._refreshing(changes)
+        _GenericHub._patch(self, changes, partial)
+
+    def _refreshing(self, changes):
+        expires = self._expires
+        deadline = self._controller.clock() + self._ttl
+        for change in changes:
+            kind, k, _ = change
+            if kind == 'delete':
+                if k in expires:
+                    # Its timer is reused if the key comes back.
+                    expires[k] = None
+            else:
+                if k not in expires:
+                    self._controller.call_at(deadline, self._expire, k)
+                expires[k] = deadline
+            yield change
+
+    def _expire(self, key):
+        # One timer per key, moved on if the key was set meanwhile.
+        deadline = self._expires[key]
+        if deadline is None:
+            del self._expires[key]
+            return
+        if deadline > self._controller.clock():
+            self._controller.call_at(deadline, self._expire, key)
+            return
+        del self._expires[key]
+        if key in self._ns:
+            self._delete(key)
+
     def update(self, data, extra={}):
         """ Update all the keys and values using data from the given dictionary. """
-        with self._controller._w( (None,), 'update'):
+        with self._updating():
             self._update(data, False, extra)
 
+    def apply_delta(self, added=None, changed=None, removed=(), extra=None):
+        """ Update only the given keys: ``added`` and ``changed`` are
+        dictionaries of new values, ``removed`` lists keys to
+        drop. ``extra`` is left untouched unless given. """
+        self.patch(self._delta(added, changed, removed), extra)
+
+    def patch(self, changes, extra=None):
+        """ Apply a change log, an iterable of ``(kind, key, value)``
+        tuples where kind is one of 'add', 'set' or 'delete'. """
+        with self._updating():
+            if extra is not None:
+                self._set_extra(extra)
+            self._patch(changes, False)
+
     def get(self, key):
         """ Get Cell for a ``key``. Raise exception if key doesn't exist. """
         if key not in self._ns:
             raise KeyError(key)
         return self._ns[key]
 
+    def _load(self, state, hubs):
+        _GenericHub._load(self, state, hubs)
+        self.update(state['values'], state['extra'])
+
 
 class ComputableHub(_GenericHub):
+    _cell_class = ComputedCell
+
+    def __init__(self, controller):
+        _GenericHub.__init__(self, controller)
+        self._sources = {}
+
     def maintain(self, key, fun, *args, **kwargs):
         """ Set ``key`` to be a ComputedCell with given function to
         compute the value."""
         if key in self._ns:
             raise KeyError(key)
         with self._controller._w( (None, 'update'), 'update'):
-            v = self._add(key, ComputedCell(self._controller, fun, *args, **kwargs))
+            v = self._add(key, self._cell_class(self._controller, fun, *args, **kwargs))
             return v
 
+    def maintain_many(self, items):
+        """ Maintain many keys at once. ``items`` yields ``(key, fun,
+        arg, ...)`` tuples. The new ComputedCells are computed together,
+        once the update cycle ends, like cells dirtied by an update. """
+        with self._controller.batch():
+            with self._controller._w( (None, 'update'), 'update'):
+                for item in items:
+                    key, fun, args = item[0], item[1], item[2:]
+                    if key in self._ns:
+                        raise KeyError(key)
+                    self._add(key, self._cell_class(self._controller, fun, *args),
+                              run=False)
+
+    def map_from(self, source, fun, *args):
+        """ Keep a ComputedCell computing ``fun(cell, *args)`` for
+        every ``cell`` of the hub ``source``, under the same key. Keys
+        added to the source in one update are computed together. """
+        if source in self._sources:
+            raise KeyError(source)
+        self._sources[source] = (fun, args)
+        self._controller.subscribe(source, self._on_source, fun, args)
+        self.maintain_many((key, fun, source._ns[key]) + args
+                           for key in source.keys())
+
+    def unmap_from(self, source):
+        """ Stop following ``source``, remove the keys mapped from it. """
+        fun, args = self._sources.pop(source)
+        self._controller.unsubscribe(source, self._on_source, fun, args)
+        for key in source.keys():
+            if key in self._ns:
+                self.unmaintain(key)
+
+    def _on_source(self, source, kind, key, cell, fun, args):
+        if kind == 'add':
+            with self._controller.batch():
+                if key in self._ns:
+                    raise KeyError(key)
+                self._add(key, self._cell_class(self._controller, fun, cell, *args),
+                          run=False)
+        elif kind == 'delete':
+            self.unmaintain(key)
+
     def unmaintain(self, key):
         """ Remove ComputedCell for ``key``. """
         if key not in self._ns:
             raise KeyError(key)
         v = self._ns[key]
-        self._delete(key)
-        v._destroy()
+        with self._controller._w( (None, 'update'), 'update'):
+            self._delete(key)
+            v._destroy()
 
     def get(self, key):
         """ Get ComputedCell for a ``key``. Raise exception if key doesn't exist. """
@@ -108,33 +455,113 @@ class ComputableHub(_GenericHub):
         return self._ns[key]
 
 
+class LazyComputableHub(ComputableHub):
+    """ A ComputableHub holding LazyComputedCells. Values are computed
+    when read, through ``get(key).value`` or ``dump()``. """
+    _cell_class = LazyComputedCell
+
+    def dump(self):
+        for cell in self._ns.values():
+            cell._refresh()
+        return ComputableHub.dump(self)
+
+
 class QueryHub(_GenericHub):
-    _last_data = None
+    # Last seen responses, shared by reference between versions.
+    _last_data = FrozenMap()
+
+    def __init__(self, controller, retain=0):
+        """ Keys no longer read by any ComputedCell are dropped, except
+        for the ``retain`` most recently dropped ones, kept in case they
+        are read again soon. """
+        _GenericHub.__init__(self, controller)
+        self._retain = retain
+        # Unreferenced keys kept around, oldest first.
+        self._retained = collections.OrderedDict()
 
     def get(self, key, default=None):
         """ Get Cell for a ``key``. During a computation cycle create
         one if it doesn't exist yet."""
+        cell = self._ns.get(key)
+        if cell is not None:
+            return cell
         already_present = False
-        if self._last_data:
-            if key in self._last_data:
-                default = self._last_data[key]
-                already_present = True
+        if key in self._last_data:
+            default = self._last_data[key]
+            already_present = True
 
         if key not in self._ns:
             if self._controller.cycle not in ('running',) and already_present == False:
                 # key error if not within a running stage
                 raise KeyError(key)
-            cell = Cell(self._controller, default)
-            self._add(key, cell)
-            def fun():
-                if len(self._controller._referenced_by(cell)) == 1:
-                    self._delete(key)
-            cell._on_lost_reference = fun
-            return cell
+            return self._create(key, default)
         return self._ns[key]
 
+    def _create(self, key, default):
+        # computations may run in parallel
+        with self._controller._lock:
+            if key not in self._ns:
+                cell = Cell(self._controller, default)
+                self._add(key, cell)
+                def fun():
+                    # Only the hub itself left?
+                    if self._controller._refcount(cell) == 1:
+                        self._drop(key)
+                cell._on_lost_reference = fun
+                return cell
+        return self._ns[key]
+
+    def _drop(self, key):
+        if not self._retain:
+            self._delete(key)
+            return
+        self._retained.pop(key, None)
+        self._retained[key] = None
+        while len(self._retained) > self._retain:
+            key, _ = self._retained.popitem(last=False)
+            # Skip the ones read again meanwhile.
+            if key in self._ns and self._controller._refcount(self._ns[key]) == 1:
+                self._delete(key)
+
+    def _save(self, names):
+        state = _GenericHub._save(self, names)
+        # Cells are created again by the cells reading them.
+        state['values'] = dict(self._last_data.iteritems())
+        return state
+
+    def _load(self, state, hubs):
+        _GenericHub._load(self, state, hubs)
+        self._last_data = FrozenMap(state['values'],
+                                    self._last_data.version + 1)
+
+    def _peek(self, key):
+        if key in self._ns:
+            return self._ns[key]._value
+        return self._last_data.get(key, _missing)
+
+    def _input(self, key):
+        if key in self._ns:
+            return self._ns[key]
+        return self._create(key, self._last_data[key])
+
     def update(self, data, extra={}):
         """ Update all the keys and values using data from the given dictionary. """
-        with self._controller._w( (None,), 'update'):
-            self._last_data = copy.deepcopy(data)
+        with self._updating():
+            self._last_data = FrozenMap(data, self._last_data.version + 1)
             self._update(data, True, extra)
+
+    def apply_delta(self, added=None, changed=None, removed=(), extra=None):
+        """ Update only the given keys: ``added`` and ``changed`` are
+        dictionaries of new values, ``removed`` lists keys to
+        forget. ``extra`` is left untouched unless given. """
+        self.patch(self._delta(added, changed, removed), extra)
+
+    def patch(self, changes, extra=None):
+        """ Apply a change log, an iterable of ``(kind, key, value)``
+        tuples where kind is one of 'add', 'set' or 'delete'. """
+        with self._updating():
+            if extra is not None:
+                self._set_extra(extra)
+            changes = list(changes)
+            self._last_data = self._last_data.evolve(changes)
+            self._patch(changes, True)
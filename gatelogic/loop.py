@@ -0,0 +1,100 @@
+import Queue
+import threading
+
+
+class EventLoop(object):
+    """ Drives a Controller from events instead of a polling loop.
+
+    The controller isn't thread safe, all the work happens on the
+    thread calling ``run()``. Other threads hand work over with
+    ``submit()``, ``feed()`` reads a hub's source on its own thread.
+    Events arriving together are applied in a single batch. """
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._events = Queue.Queue()
+        self._thread = None
+        self._stopped = False
+
+    def submit(self, fun, *args, **kwargs):
+        """ Call ``fun`` on the loop thread. Can be called from any
+        thread. """
+        self._events.put((fun, args, kwargs))
+
+    def feed(self, hub, source):
+        """ Update ``hub`` with every dictionary produced by the
+        iterable ``source``. The iteration blocks a daemon thread, not
+        the loop. """
+        def reader():
+            for data in source:
+                self.submit(hub.update, data)
+        thread = threading.Thread(target=reader, name='feed-%r' % (hub,))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def wait_changed(self, cell, timeout=None):
+        """ Block the calling thread until the value of ``cell``
+        changes, return the new value. Raise ``Queue.Empty`` on
+        timeout. Can't be called from the loop thread. """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("wait_changed() would block the loop")
+
+        changed = Queue.Queue(1)
+        def on_change(_obj, kind, _key, value):
+            if kind == 'set' and not changed.full():
+                changed.put(value)
+
+        self.submit(self._controller.subscribe, cell, on_change)
+        try:
+            return changed.get(True, timeout)
+        finally:
+            self.submit(self._controller.unsubscribe, cell, on_change)
+
+    def run_once(self, timeout=None):
+        """ Wait for events and process all the queued ones. Return
+        the number of events processed, 0 on timeout.
+
+        The wait ends early for the controller's timers, which run
+        after the events. With a controller ``budget``, propagations
+        left pending are resumed when no events are waiting, so that
+        new events are served in between. """
+        self._thread = threading.current_thread()
+        controller = self._controller
+        due = controller.next_timer()
+        if due is not None:
+            # Wake up for the next timer.
+            wait = max(0, due - controller.clock())
+            timeout = wait if timeout is None else min(timeout, wait)
+        try:
+            if controller.pending():
+                events = [self._events.get_nowait()]
+            else:
+                events = [self._events.get(True, timeout)]
+        except Queue.Empty:
+            controller.run_timers()
+            if controller.pending():
+                controller.resume()
+            return 0
+        while True:
+            try:
+                events.append(self._events.get_nowait())
+            except Queue.Empty:
+                break
+
+        with controller.batch():
+            for fun, args, kwargs in events:
+                fun(*args, **kwargs)
+        controller.run_timers()
+        return len(events)
+
+    def run(self):
+        """ Process events until ``stop()`` is called. """
+        self._stopped = False
+        while not self._stopped:
+            self.run_once()
+
+    def stop(self):
+        """ Make ``run()`` return after the queued events. Can be
+        called from any thread. """
+        self.submit(setattr, self, '_stopped', True)
@@ -0,0 +1,223 @@
+'''
+A ComputableHub computed by worker processes.
+
+Every worker runs its own Controller with copies of the input hubs,
+kept up to date through a pipe. Partitioned inputs are split by key,
+each key goes to one worker only; replicated inputs are copied to all
+the workers. The changes of the workers' output hubs are merged back
+into one ReadableHub in the parent.
+
+Workers are forked, so that ``setup`` can be any function, closures
+included.
+'''
+
+import Queue
+import multiprocessing
+import threading
+import traceback
+
+from .hub import ComputableHub, QueryHub, ReadableHub
+from .sink import Sink
+from .xcontroller import Controller
+
+
+def _worker(conn, setup, queries):
+    try:
+        c = Controller()
+        inputs = [QueryHub(c) if query else ReadableHub(c)
+                  for query in queries]
+        out = []
+        requests = []
+        sinks = [Sink(hub, lambda changes, i=i: requests.append((i, changes)),
+                      mode='delta')
+                 for i, hub in enumerate(inputs) if queries[i]]
+        output = setup(c, inputs)
+        sinks.append(Sink(output, out.extend, mode='delta'))
+
+        while True:
+            msg = conn.recv()
+            if msg[0] == 'patch':
+                _, i, changes, extra = msg
+                inputs[i].patch(changes, extra)
+            # Sinks flush when the update cycle ends.
+            for i, changes in requests:
+                conn.send(('requests', i, changes))
+            del requests[:]
+            if out:
+                conn.send(('out', out[:]))
+                del out[:]
+            if msg[0] == 'sync':
+                conn.send(('synced', msg[1]))
+            elif msg[0] == 'stop':
+                break
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def _demand(hub, key):
+    # Keeps ``key`` requested from a QueryHub while a worker reads it.
+    return hub.get(key).value
+
+
+class ShardedComputableHub(ReadableHub):
+    """ A hub computed by ``shards`` worker processes, updated on
+    ``poll()`` or ``sync()``.
+
+    Every worker calls ``setup(controller, inputs)``, which returns the
+    worker's ComputableHub. ``inputs`` are hubs mirroring
+    ``partitioned`` followed by ``replicated``, QueryHubs for QueryHubs
+    and ReadableHubs otherwise. Keys of the ``partitioned`` hubs are
+    spread over the workers by ``shard_of(key)``, ``hash()`` modulo the
+    number of workers by default. Keys the workers request from a
+    QueryHub are requested from the original, the responses go to the
+    workers asking too. """
+
+    def __init__(self, controller, setup, shards, partitioned,
+                 replicated=(), shard_of=None):
+        ReadableHub.__init__(self, controller)
+        self._inputs = list(partitioned) + list(replicated)
+        self._partitioned = len(partitioned)
+        self._shard_of = shard_of or (lambda key: hash(key) % shards)
+        queries = [isinstance(hub, QueryHub) for hub in self._inputs]
+
+        self._conns = []
+        self._procs = []
+        # Messages from the workers, read on threads so that a worker
+        # never blocks sending while we send to it.
+        self._received = Queue.Queue()
+        for shard in xrange(shards):
+            conn, child = multiprocessing.Pipe()
+            proc = multiprocessing.Process(target=_worker,
+                                           args=(child, setup, queries))
+            proc.daemon = True
+            proc.start()
+            child.close()
+            thread = threading.Thread(target=self._read, args=(shard, conn))
+            thread.daemon = True
+            thread.start()
+            self._conns.append(conn)
+            self._procs.append(proc)
+
+        # QueryHub keys requested by workers: (input, key) -> shards
+        self._requested = {}
+        self._queries = queries
+        self._demands = ComputableHub(controller)
+        self._extras = [None] * len(self._inputs)
+        self._seq = 0
+        self._sent = 0
+        self._sinks = []
+        for i, hub in enumerate(self._inputs):
+            if queries[i]:
+                data = hub._last_data.iteritems()
+            else:
+                data = hub.dump().iteritems()
+            self._route(i, [('add', k, v) for k, v in data])
+            self._sinks.append(Sink(hub, lambda changes, i=i:
+                                    self._route(i, changes), mode='delta'))
+
+    def _route(self, i, changes):
+        hub = self._inputs[i]
+        extra = None
+        if hub.extra != self._extras[i]:
+            extra = self._extras[i] = dict(hub.extra)
+        if i < self._partitioned:
+            split = [[] for _ in self._conns]
+            for change in changes:
+                owner = self._shard_of(change[1])
+                split[owner].append(change)
+                if self._queries[i]:
+                    # Responses to the other shards asking for the key.
+                    for shard in self._requested.get((i, change[1]), ()):
+                        if shard != owner:
+                            split[shard].append(change)
+        else:
+            split = [changes] * len(self._conns)
+        for conn, part in zip(self._conns, split):
+            if part or extra is not None:
+                conn.send(('patch', i, part, extra))
+                self._sent += 1
+
+    def _read(self, shard, conn):
+        try:
+            while True:
+                self._received.put((shard, conn.recv()))
+        except (EOFError, IOError):
+            pass
+
+    def _receive(self, shard, msg):
+        if msg[0] == 'out':
+            self.patch(msg[1])
+        elif msg[0] == 'requests':
+            _, i, changes = msg
+            with self._controller.batch():
+                for kind, key, _ in changes:
+                    if kind != 'set':
+                        self._request(i, key, shard, kind == 'add')
+        elif msg[0] == 'error':
+            raise RuntimeError("Shard failed:\n%s" % (msg[1],))
+
+    def _request(self, i, key, shard, add):
+        hub = self._inputs[i]
+        shards = self._requested.get((i, key))
+        if add:
+            if i < self._partitioned and key in hub._ns and \
+                    shard != self._shard_of(key):
+                # Present already, only its owner got the value.
+                self._conns[shard].send(
+                    ('patch', i, [('add', key, hub._ns[key]._value)], None))
+                self._sent += 1
+            if shards is None:
+                shards = self._requested[i, key] = set()
+                self._demands.maintain((i, key), _demand, hub, key)
+            shards.add(shard)
+        elif shards is not None and shard in shards:
+            shards.discard(shard)
+            if not shards:
+                del self._requested[i, key]
+                self._demands.unmaintain((i, key))
+
+    def poll(self):
+        """ Apply the results the workers sent so far, without
+        waiting. """
+        with self._controller.batch():
+            while True:
+                try:
+                    shard, msg = self._received.get_nowait()
+                except Queue.Empty:
+                    break
+                self._receive(shard, msg)
+
+    def sync(self):
+        """ Wait until the workers processed every change, including
+        the responses to their requests, and apply their results. """
+        while True:
+            sent = self._sent
+            self._seq += 1
+            for conn in self._conns:
+                conn.send(('sync', self._seq))
+            synced = 0
+            while synced < len(self._conns):
+                shard, msg = self._received.get()
+                if msg[0] == 'synced':
+                    synced += msg[1] == self._seq
+                else:
+                    self._receive(shard, msg)
+            # Handling the results might have sent more changes.
+            if self._sent == sent:
+                return
+
+    def close(self):
+        """ Stop the workers and following the inputs. """
+        for sink in self._sinks:
+            sink.close()
+        for conn in self._conns:
+            conn.send(('stop',))
+        for proc in self._procs:
+            proc.join()
+        for conn in self._conns:
+            conn.close()
+        for key in self._demands.keys():
+            self._demands.unmaintain(key)
+        self._requested.clear()
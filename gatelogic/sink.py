@@ -0,0 +1,170 @@
+import Queue
+import collections
+
+from .xcontroller import _missing
+
+
+class Sink(object):
+    """ Hands the changes of a hub over to ``flush`` once per update
+    cycle, instead of on every add, delete or set event.
+
+    In 'snapshot' mode ``flush`` is called with ``hub.dump()``. In
+    'delta' mode it gets a list of ``(kind, key, value)`` changes, one
+    per key, folded since the previous flush.
+
+    With ``debounce`` (seconds) the flush waits until the hub was quiet
+    for that long, but no longer than ``max_latency`` after the first
+    pending change. Deferred flushes are due at ``deadline()``, a timer
+    of the controller then flushes them once ``run_timers()`` runs, as
+    EventLoop does on time. They also happen on the next update cycle
+    or on ``poll()``. ``clock`` is the controller's by default. """
+
+    def __init__(self, hub, flush, mode='snapshot', debounce=None,
+                 max_latency=None, clock=None):
+        assert mode in ('snapshot', 'delta'), mode
+        self._hub = hub
+        self._flush = flush
+        self._mode = mode
+        self._debounce = debounce
+        self._max_latency = max_latency
+        self._clock = clock or hub._controller.clock
+        # key -> [first kind, last kind]
+        self._changes = collections.OrderedDict()
+        self._first = self._last = None
+        # Time of the timer waiting for the deadline, None if none.
+        self._armed = None
+
+        hub._controller.subscribe(hub, self._on_event)
+        hub._controller.add_settle_hook(self.poll)
+
+    def _on_event(self, _hub, kind, key, _cell):
+        change = self._changes.get(key)
+        if change is None:
+            self._changes[key] = [kind, kind]
+        else:
+            change[1] = kind
+        self._last = self._clock()
+        if self._first is None:
+            self._first = self._last
+        if self._debounce is not None and self._armed is None:
+            self._arm()
+
+    def _arm(self):
+        self._armed = self.deadline()
+        self._hub._controller.call_at(self._armed, self._wake)
+
+    def _wake(self):
+        # Runs within run_timers(), poll() flushes once it settles,
+        # when hub updates are allowed again.
+        self._armed = None
+
+    def pending(self):
+        """ Are there changes waiting to be flushed? """
+        return self._first is not None
+
+    def deadline(self):
+        """ Time when the pending changes are due, None if there are
+        none. """
+        if self._first is None:
+            return None
+        if self._debounce is None:
+            return self._last
+        due = self._last + self._debounce
+        if self._max_latency is not None:
+            due = min(due, self._first + self._max_latency)
+        return due
+
+    def poll(self):
+        """ Flush if the pending changes are due. """
+        due = self.deadline()
+        if due is not None and due <= self._clock():
+            self.flush()
+        elif due is not None and self._armed is None:
+            # The timer went off, but the hub changed meanwhile.
+            self._arm()
+
+    def _take(self):
+        # Pending changes, forgotten.
+        changes, self._changes = self._changes, collections.OrderedDict()
+        self._first = self._last = None
+        return changes
+
+    def flush(self):
+        """ Flush the pending changes now. """
+        if self._first is None:
+            return
+        changes = self._take()
+
+        if self._mode == 'snapshot':
+            self._flush(self._hub.dump())
+            return
+
+        delta = []
+        for key, (first, last) in changes.iteritems():
+            if last == 'delete':
+                if first != 'add':
+                    delta.append(('delete', key, None))
+            else:
+                kind = 'add' if first == 'add' else 'set'
+                delta.append((kind, key, self._hub._ns[key].value))
+        if delta:
+            self._flush(delta)
+
+    def close(self):
+        """ Flush and stop following the hub. """
+        self.flush()
+        self._hub._controller.unsubscribe(self._hub, self._on_event)
+        self._hub._controller.remove_settle_hook(self.poll)
+
+
+class ChangeSet(collections.namedtuple('ChangeSet',
+                                       'added removed changed')):
+    """ Changes of a hub: ``added`` and ``removed`` map keys to their
+    new and old values, ``changed`` maps keys to ``(old, new)``
+    pairs. """
+    __slots__ = ()
+
+
+class Changefeed(Sink):
+    """ Hands the changes of a hub over to ``fun`` as one ChangeSet per
+    update cycle, with the old and the new values. A key changed back
+    and forth within the cycle isn't reported.
+
+    Without ``fun`` the ChangeSets are put on ``queue``, for consumers
+    on other threads, see ``get()``. With ``maxsize`` the queue is
+    bounded, the update cycle blocks until there is room. Other keyword
+    arguments are the ones of Sink. """
+
+    def __init__(self, hub, fun=None, maxsize=0, **kwargs):
+        self.queue = None
+        if fun is None:
+            self.queue = Queue.Queue(maxsize)
+            fun = self.queue.put
+        # Values as of the last flush, to report the old ones.
+        self._values = hub.dump()
+        Sink.__init__(self, hub, fun, mode='delta', **kwargs)
+
+    def flush(self):
+        if self._first is None:
+            return
+        ns = self._hub._ns
+        values = self._values
+        added, removed, changed = {}, {}, {}
+        for key in self._take():
+            old = values.get(key, _missing)
+            if key not in ns:
+                if old is not _missing:
+                    removed[key] = values.pop(key)
+                continue
+            new = values[key] = ns[key].value
+            if old is _missing:
+                added[key] = new
+            elif old != new:
+                changed[key] = (old, new)
+        if added or removed or changed:
+            self._flush(ChangeSet(added, removed, changed))
+
+    def get(self, timeout=None):
+        """ Wait for the next ChangeSet on the queue. Raise
+        ``Queue.Empty`` on timeout. """
+        return self.queue.get(True, timeout)
@@ -0,0 +1,159 @@
+import collections
+import threading
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+                     .replace('\n', '\\n')
+
+
+class Stats(object):
+    """ Collects propagation statistics of a Controller, install it
+    with ``Controller.set_stats()``.
+
+    The controller calls the ``on_*`` hooks below, override them to
+    send the numbers elsewhere. Nothing is measured while no Stats is
+    installed. """
+
+    # Upper bounds of the fan-out histogram buckets.
+    fanout_buckets = (0, 1, 10, 100, 1000, 10000, 100000)
+
+    def __init__(self):
+        # Parallel computations report from worker threads.
+        self._lock = threading.Lock()
+        self._names = {}
+        self.reset()
+
+    def reset(self):
+        """ Forget everything collected so far. """
+        # cell id -> [function name, runs, seconds]
+        self.runs = {}
+        # hub -> [updates, seconds]
+        self.hub_updates = {}
+        self.fanout = [0] * (len(self.fanout_buckets) + 1)
+        self.fanout_sum = 0
+        self.fanout_max = 0
+        self.subscribed = 0
+        self.unsubscribed = 0
+
+    def name(self, hub, name):
+        """ Report ``hub`` as ``name`` instead of its class and id. """
+        self._names[hub] = name
+
+    def _hub_name(self, hub):
+        name = self._names.get(hub)
+        if name is None:
+            name = '%s@%x' % (hub.__class__.__name__, id(hub))
+        return name
+
+    def on_run(self, cell, seconds):
+        """ ``cell`` was computed, in ``seconds``. """
+        with self._lock:
+            run = self.runs.get(cell._id)
+            if run is None:
+                fun = cell._fun[0]
+                run = self.runs[cell._id] = [
+                    getattr(fun, '__name__', repr(fun)), 0, 0.0]
+            run[1] += 1
+            run[2] += seconds
+
+    def on_dirty(self, obj, kind, fanout):
+        """ ``obj`` changed, notifying ``fanout`` subscribers. """
+        i = 0
+        for bound in self.fanout_buckets:
+            if fanout <= bound:
+                break
+            i += 1
+        self.fanout[i] += 1
+        self.fanout_sum += fanout
+        if fanout > self.fanout_max:
+            self.fanout_max = fanout
+
+    def on_subscribe(self, obj, fun):
+        self.subscribed += 1
+
+    def on_unsubscribe(self, obj, fun):
+        self.unsubscribed += 1
+
+    def on_hub_update(self, hub, seconds):
+        """ An update of ``hub`` took ``seconds``, propagation
+        included. """
+        update = self.hub_updates.get(hub)
+        if update is None:
+            update = self.hub_updates[hub] = [0, 0.0]
+        update[0] += 1
+        update[1] += seconds
+
+    def functions(self):
+        """ Return ``{function name: (runs, seconds)}``, summed over
+        all the cells computing it. """
+        totals = collections.defaultdict(lambda: [0, 0.0])
+        with self._lock:
+            for name, runs, seconds in self.runs.itervalues():
+                total = totals[name]
+                total[0] += runs
+                total[1] += seconds
+        return dict((name, tuple(total)) for name, total in totals.iteritems())
+
+    def top(self, n=10):
+        """ Return the ``n`` cells that took the most time, as
+        ``(seconds, runs, function name, cell id)``. """
+        with self._lock:
+            items = [(seconds, runs, name, id)
+                     for id, (name, runs, seconds) in self.runs.iteritems()]
+        items.sort(reverse=True)
+        return items[:n]
+
+    def snapshot(self):
+        """ Return everything collected as plain dictionaries. """
+        return {
+            'functions': self.functions(),
+            'fanout': {
+                'buckets': zip(self.fanout_buckets + (None,), self.fanout),
+                'count': sum(self.fanout),
+                'sum': self.fanout_sum,
+                'max': self.fanout_max,
+            },
+            'subscribed': self.subscribed,
+            'unsubscribed': self.unsubscribed,
+            'hub_updates': dict((self._hub_name(hub), tuple(update))
+                                for hub, update in self.hub_updates.items()),
+        }
+
+    def prometheus(self, prefix='gatelogic'):
+        """ Return the statistics in the Prometheus text exposition
+        format. Cells are summed up per function. """
+        lines = []
+        def metric(name, kind, samples):
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+            for labels, value in samples:
+                lines.append('%s_%s%s %r' % (prefix, name, labels, value))
+
+        functions = sorted(self.functions().iteritems())
+        metric('cell_runs_total', 'counter',
+               [('{function="%s"}' % _label(name), runs)
+                for name, (runs, _) in functions])
+        metric('cell_run_seconds_total', 'counter',
+               [('{function="%s"}' % _label(name), seconds)
+                for name, (_, seconds) in functions])
+
+        buckets, count = [], 0
+        for bound, n in zip(self.fanout_buckets, self.fanout):
+            count += n
+            buckets.append(('_bucket{le="%s"}' % (bound,), count))
+        buckets.append(('_bucket{le="+Inf"}', sum(self.fanout)))
+        metric('dirty_fanout', 'histogram', buckets +
+               [('_sum', self.fanout_sum), ('_count', sum(self.fanout))])
+
+        metric('subscriptions_total', 'counter',
+               [('{op="subscribe"}', self.subscribed),
+                ('{op="unsubscribe"}', self.unsubscribed)])
+
+        updates = sorted((self._hub_name(hub), update)
+                         for hub, update in self.hub_updates.items())
+        metric('hub_updates_total', 'counter',
+               [('{hub="%s"}' % _label(name), n) for name, (n, _) in updates])
+        metric('hub_update_seconds_total', 'counter',
+               [('{hub="%s"}' % _label(name), seconds)
+                for name, (_, seconds) in updates])
+        return '\n'.join(lines) + '\n'
@@ -1,11 +1,29 @@
 import collections
+import contextlib
+import cPickle
+import heapq
+import itertools
+import os
+import tempfile
+import threading
+import time
 
 
 class Cell(object):
     """ A Cell holds a ``value``. """
+    __slots__ = ('_controller', '_value', '_id', '_version', '_priority',
+                 '_on_lost_reference')
+
+    # Rank in the dependency graph: a ComputedCell is always higher
+    # than any cell it reads.
+    _height = 0
+
     def __init__(self, controller, default=None):
         self._controller = controller
         self._value = default
+        self._id = next(controller._ids)
+        self._version = controller._tick()
+        self._priority = 0
 
     def _get_value(self):
         self._controller._register_read(self)
@@ -18,6 +36,7 @@ class Cell(object):
 
             if self._value is not value:
                 self._value = value
+                self._version = self._controller._tick()
                 self._controller._dirty(self, 'set', None, value)
 
     """ Property containing the value of the Cell. You can read and set it. """
@@ -36,25 +55,76 @@ class Cell(object):
 class ComputedCell(Cell):
     """ A ComputedCell holds a ``value`` which is computed by a given
     function. """
+    __slots__ = ('_fun', '_height', '_verified', '_wave', '_wave_runs')
+
+    # Recompute only when the value is needed.
+    _lazy = False
+
     def __init__(self, controller, fun, *args, **kwargs):
         self._controller = controller
-        self._fun = (fun, args, kwargs)
+        self._id = next(controller._ids)
+        self._version = controller._tick()
+        # Most functions take no keyword arguments, don't keep an empty
+        # dict around for every cell.
+        self._fun = (fun, args, kwargs or None)
         self._value = None
+        self._priority = 0
+        self._height = 1
+        # Controller clock at the last run, None if never run.
+        self._verified = None
+        self._wave = None
+        self._wave_runs = 0
+
+    def _inputs_changed(self):
+        verified = self._verified
+        if verified is None:
+            return True
+        for obj in self._controller._rev_links.get(self, ()):
+            if obj._version > verified:
+                return True
+        return False
+
+    def _call(self):
+        fun, args, kwargs = self._fun
+        if kwargs:
+            return fun(*args, **kwargs)
+        return fun(*args)
 
     def _run(self):
+        if not self._inputs_changed():
+            self._controller._counters['runs_skipped'] += 1
+            return
+
+        stats = self._controller._stats
         with self._controller._w( ('update',), 'running'):
             self._controller._read = set()
 
+            if stats is not None:
+                t0 = time.time()
+            # _call() inlined, this is the hottest path
             fun, args, kwargs = self._fun
-            value = fun(*args, **kwargs)
+            value = fun(*args, **kwargs) if kwargs else fun(*args)
+            if stats is not None:
+                stats.on_run(self, time.time() - t0)
 
             touched, self._controller._read = \
                 self._controller._read, None
+            first = self._verified is None
+            # Cells created by the function count as already seen.
+            self._verified = self._controller._clock
+
+        self._apply(value, touched, first)
 
+    def _apply(self, value, touched, first=False):
+        # The first value is announced even if it is the initial None,
+        # hub followers skip the cells never computed.
         self._controller._fix_subscriptions(self, touched)
-        if self._value is not value:
+        if self._value != value or first:
             self._value = value
+            self._version = self._controller._tick()
             self._controller._dirty(self, 'set', None, value)
+        else:
+            self._controller._counters['values_unchanged'] += 1
 
     def _first_run(self):
         self._run()
@@ -63,84 +133,647 @@ class ComputedCell(Cell):
         self._run()
 
 
+class LazyComputedCell(ComputedCell):
+    """ A ComputedCell that is recomputed when its ``value`` is read,
+    instead of on every change of its inputs. It is kept up to date
+    eagerly only while other ComputedCells depend on it. """
+    __slots__ = ()
+
+    _lazy = True
+
+    def _get_value(self):
+        self._refresh()
+        return ComputedCell._get_value(self)
+
+    value = property(_get_value, Cell._set_value)
+
+    def _first_run(self):
+        pass
+
+    def _refresh(self):
+        if not self._inputs_changed():
+            return
+        controller = self._controller
+        if controller._parallel:
+            # Read from a worker thread, the cycle is shared and must
+            # stay 'running'.
+            with controller._lock:
+                if self._inputs_changed():
+                    value, touched = controller._evaluate(self)
+                    first = self._verified is None
+                    self._verified = controller._clock
+                    self._apply(value, touched, first)
+            return
+        # Can be read from within another computation, keep its reads.
+        read = controller._read
+        try:
+            with controller._w( (None, 'update', 'running'), 'update'):
+                self._run()
+        finally:
+            controller._read = read
+
+
+def _split(entry):
+    # Subscriptions without arguments, like the ones between cells, are
+    # stored bare to save a tuple per edge.
+    if type(entry) is tuple:
+        return entry
+    return entry, ()
+
+
+# Format of the files written by Controller.snapshot()
+_SNAPSHOT_VERSION = 1
+
+# Marks a key without a value, where None is a valid value.
+_missing = object()
+
+_empty = frozenset()
+
+
+def _node(fun):
+    # Subscribed methods, like a hub following its cells, stand for
+    # their object in the graph.
+    return getattr(fun, '__self__', None) or fun
+
+
+class _Guard(object):
+    """ Context manager switching the controller to ``new_cycle``, from
+    one of ``ok_cycles`` only. """
+    __slots__ = ('_controller', '_ok_cycles', '_new_cycle')
+
+    def __init__(self, controller, ok_cycles, new_cycle):
+        self._controller = controller
+        self._ok_cycles = frozenset(ok_cycles)
+        self._new_cycle = new_cycle
+
+    def __enter__(self):
+        o = self._controller
+        if o.cycle not in self._ok_cycles:
+            raise Exception("Cycle %r is not in %r" % (o.cycle, set(self._ok_cycles)))
+        o._cycles.append(o.cycle)
+        o.cycle = self._new_cycle
+
+    def __exit__(self, type, value, traceback):
+        o = self._controller
+        o.cycle = o._cycles.pop()
+        if o.cycle is None and o._settle_hooks and not o._batch_depth \
+                and type is None:
+            o._settle()
+
+
 class Controller(object):
     cycle = None
-
-    def __init__(self):
+    # How many times a single ComputedCell may run within one wave
+    # before the graph is considered to be cyclic.
+    max_reruns = 100
+    # Seconds a propagation may take before yielding, None for no
+    # limit. The rest waits for resume() or the next update.
+    budget = None
+
+    def __init__(self, executor=None, clock=time.time):
+        """ ``executor`` is an optional thread pool, anything with a
+        ``map()`` method like ``multiprocessing.pool.ThreadPool``. When
+        given, dirty ComputedCells of the same height are computed on
+        it in parallel. ``clock`` tells the time to the timers. """
+        self._executor = executor
+        self.clock = clock
+        # Heap of (deadline, id, fun, args), see call_at()
+        self._timers = []
+        # deadline -> Cell, read through at()
+        self._deadlines = {}
+        self._parallel = False
+        # Reads of computations running on other threads
+        self._local = threading.local()
+        self._lock = threading.RLock()
         self._read = None
         self._links = collections.defaultdict(set)
         self._rev_links = collections.defaultdict(set)
+        self._batch_depth = 0
+        # Cell and timer ids
+        self._ids = itertools.count()
+        # Dirty ComputedCells in buckets of the same (-priority,
+        # height), oldest first, and the heap of the bucket keys.
+        self._buckets = {}
+        self._queue = []
+        # Priority of the cells running now, passed on to the cells
+        # they dirty.
+        self._running_priority = 0
+        # Queued cell -> priority, entries of other priorities are stale.
+        self._queued = {}
+        # Cells computed in parallel, waiting to be applied
+        self._applying = set()
+        self._wave = 0
+        # Logical clock, cells remember when they last changed.
+        self._clock = 0
+        self._counters = collections.defaultdict(int)
+        # Optional Stats, see set_stats()
+        self._stats = None
+        # Saved ComputedCells waiting to be maintained again, see
+        # restore(): (hub, key) -> (function name, value, inputs)
+        self._restored = {}
+        self._settle_hooks = []
+        self._settling = False
+        self._guards = {}
+        # Cycles to return to, see _Guard
+        self._cycles = []
 
     def _dirty(self, obj, kind, k, v):
         assert kind in ('add', 'delete', 'set'), kind
-        if obj in self._links:
+        links = self._links.get(obj)
+        if self._stats is not None:
+            self._stats.on_dirty(obj, kind, len(links or ()))
+        if links:
+            priority = self._running_priority
+            if obj._priority > priority:
+                priority = obj._priority
             # copy to avoid changing size
-            for fun in frozenset(self._links[obj]):
-                fun, args = fun
-                fun(obj, kind, k, v, *args)
+            for fun in tuple(links):
+                if isinstance(fun, ComputedCell):
+                    if not fun._lazy or self._demanded(fun):
+                        self._enqueue(fun, priority)
+                    continue
+                # _split() inlined
+                if type(fun) is tuple:
+                    fun[0](obj, kind, k, v, *fun[1])
+                else:
+                    fun(obj, kind, k, v)
+        # A computation may add cells, propagate once it is done.
+        if self._queue and not self._batch_depth and self.cycle != 'running':
+            self._propagate()
+
+    def _demanded(self, cell):
+        # Is any other ComputedCell depending on ``cell``?
+        for fun in self._links.get(cell, ()):
+            if isinstance(fun, ComputedCell):
+                return True
+        return False
+
+    def _set_internal(self, cell, value):
+        # Set the value of a cell kept by a hub, like an index slice,
+        # also from within a computation creating QueryHub keys.
+        cell._value = value
+        cell._version = self._tick()
+        self._dirty(cell, 'set', None, value)
+
+    def _tick(self):
+        self._clock += 1
+        return self._clock
+
+    def _enqueue(self, cell, priority=0):
+        if cell._priority > priority:
+            priority = cell._priority
+        queued = self._queued.get(cell)
+        if queued is None or queued < priority:
+            # A cell queued already moves up with a second entry.
+            self._queued[cell] = priority
+            self._push((-priority, cell._height), cell)
+
+    def _push(self, key, cell):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = collections.deque()
+            heapq.heappush(self._queue, key)
+        bucket.append(cell)
+
+    def set_priority(self, cell, priority):
+        """ Recompute ``cell`` before dirty cells of a lower priority,
+        together with the changes it causes. ComputedCells it reads get
+        at least the same priority. Priorities are never lowered. """
+        stack = [cell]
+        while stack:
+            cell = stack.pop()
+            if cell._priority >= priority:
+                continue
+            cell._priority = priority
+            if cell in self._queued:
+                self._enqueue(cell)
+            for obj in self._rev_links.get(cell, ()):
+                if isinstance(obj, ComputedCell):
+                    stack.append(obj)
+
+    def call_at(self, deadline, fun, *args):
+        """ Call ``fun(*args)`` within an update cycle once the clock
+        reaches ``deadline``, see ``run_timers()``. """
+        heapq.heappush(self._timers, (deadline, next(self._ids), fun, args))
+
+    def next_timer(self):
+        """ Time the next timer is due, None if there are none. """
+        return self._timers[0][0] if self._timers else None
+
+    def run_timers(self):
+        """ Run the timers that are due, in one update cycle. Return
+        the time the next one is due, None if there are none. """
+        now = self.clock()
+        if self._timers and self._timers[0][0] <= now:
+            with self.batch():
+                with self._w( (None,), 'update'):
+                    while self._timers and self._timers[0][0] <= now:
+                        _, _, fun, args = heapq.heappop(self._timers)
+                        fun(*args)
+        return self.next_timer()
+
+    def at(self, deadline):
+        """ Has the clock reached ``deadline``? A computation getting
+        False is recomputed once it does. """
+        if self.clock() >= deadline:
+            return True
+        if self.cycle == 'running':
+            # computations may run in parallel
+            with self._lock:
+                cell = self._deadlines.get(deadline)
+                if cell is None:
+                    cell = self._deadlines[deadline] = Cell(self, False)
+                    self.call_at(deadline, self._expire, deadline)
+                    def fun():
+                        if not self._refcount(cell) and \
+                                self._deadlines.get(deadline) is cell:
+                            del self._deadlines[deadline]
+                    cell._on_lost_reference = fun
+            self._register_read(cell)
+        return False
+
+    def now(self, granularity=1):
+        """ The time, rounded down to ``granularity`` seconds. A
+        computation reading it is recomputed when it changes. """
+        now = self.clock()
+        now -= now % granularity
+        self.at(now + granularity)
+        return now
+
+    def _expire(self, deadline):
+        cell = self._deadlines.pop(deadline, None)
+        if cell is not None:
+            cell.value = True
+
+    def pending(self):
+        """ Number of dirty ComputedCells left over by a propagation
+        that ran out of ``budget``. """
+        return len(self._queued)
+
+    def resume(self):
+        """ Continue propagating the pending changes, for up to
+        ``budget`` seconds. """
+        with self._w( (None,), 'update'):
+            if self._queue and not self._batch_depth:
+                self._propagate()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """ Coalesce updates done within the block. ComputedCells
+        depending on cells changed inside are recomputed once, when the
+        outermost batch exits. If the block raises, the changes made
+        so far stay pending until the next update or ``resume()``. """
+        self._batch_depth += 1
+        try:
+            yield self
+        except:
+            # Don't let a rule failing now replace the caller's error.
+            self._batch_depth -= 1
+            raise
+        self._batch_depth -= 1
+        # Within a computation the running cycle propagates the queue.
+        if self._queue and not self._batch_depth and \
+                self.cycle != 'running':
+            self._propagate()
+        if self.cycle is None and not self._batch_depth:
+            self._settle()
+
+    transaction = batch
+
+    def add_settle_hook(self, fun):
+        """ Call ``fun()`` every time an update cycle ends and all the
+        changes are propagated. """
+        self._settle_hooks.append(fun)
+
+    def remove_settle_hook(self, fun):
+        self._settle_hooks.remove(fun)
+
+    def _settle(self):
+        # Not before the changes are propagated completely.
+        if self._settling or not self._settle_hooks or self._queued:
+            return
+        self._settling = True
+        try:
+            for fun in list(self._settle_hooks):
+                fun()
+        finally:
+            self._settling = False
+
+    def _propagate(self):
+        # Drain dirty cells lowest height first, so that every cell runs
+        # after all of its dirty inputs are recomputed. Keep batching
+        # while draining, cells dirtied by the recomputation are queued
+        # too.
+        self._batch_depth += 1
+        self._wave += 1
+        wave = self._wave
+        deadline = None
+        if self.budget is not None:
+            deadline = time.time() + self.budget
+        try:
+            with self._w( (None, 'update'), 'update'):
+                while self._queue:
+                    self._running_priority = -self._queue[0][0]
+                    cells = self._pop(wave)
+                    if len(cells) > 1:
+                        self._run_parallel(cells)
+                    elif cells:
+                        cells[0]._run()
+                    if deadline is not None and time.time() >= deadline:
+                        # Yield, the queue is kept for resume().
+                        self._counters['propagations_sliced'] += 1
+                        break
+        except:
+            del self._queue[:]
+            self._buckets.clear()
+            self._queued.clear()
+            raise
+        finally:
+            self._running_priority = 0
+            self._batch_depth -= 1
+
+    def _pop(self, wave):
+        # Next dirty cells to run: one, or with an executor the whole
+        # bucket of the highest priority at the lowest height, which
+        # can't depend on each other.
+        queue, queued = self._queue, self._queued
+        cells = []
+        while queue and not cells:
+            key = queue[0]
+            priority, height = key
+            bucket = self._buckets[key]
+            while bucket:
+                cell = bucket.popleft()
+                if queued.get(cell) != -priority:
+                    continue
+                if height < cell._height:
+                    # Moved up since enqueued.
+                    self._push((priority, cell._height), cell)
+                    continue
+                del queued[cell]
+                if cell._wave != wave:
+                    cell._wave = wave
+                    cell._wave_runs = runs = 1
+                else:
+                    cell._wave_runs = runs = cell._wave_runs + 1
+                if runs > self.max_reruns:
+                    raise RuntimeError("%r doesn't converge, cyclic "
+                                       "dependency?" % (cell,))
+                cells.append(cell)
+                if self._executor is None:
+                    break
+            if not bucket:
+                heapq.heappop(queue)
+                del self._buckets[key]
+        return cells
+
+    def _run_parallel(self, cells):
+        todo = []
+        for cell in cells:
+            if cell._inputs_changed():
+                todo.append(cell)
+            else:
+                self._counters['runs_skipped'] += 1
+
+        with self._w( ('update',), 'running'):
+            self._parallel = True
+            try:
+                results = self._executor.map(self._evaluate, todo)
+            finally:
+                self._parallel = False
+            clock = self._clock
+
+        # Apply in queue order, independent of thread scheduling. Skip
+        # cells destroyed by applying the previous ones.
+        self._applying.update(todo)
+        try:
+            for cell, (value, touched) in zip(todo, results):
+                if cell in self._applying:
+                    first = cell._verified is None
+                    cell._verified = clock
+                    cell._apply(value, touched, first)
+            # A cell that started reading a sibling applied before it
+            # saw the sibling's old value, and wasn't subscribed yet to
+            # be dirtied by the change.
+            for cell in todo:
+                if cell in self._applying and cell._inputs_changed():
+                    self._enqueue(cell, self._running_priority)
+        finally:
+            self._applying.clear()
+
+    def _evaluate(self, cell):
+        # Compute ``cell`` on the current thread, return the value and
+        # the cells read.
+        local = self._local
+        outer = getattr(local, 'read', None)
+        local.read = set()
+        try:
+            stats = self._stats
+            if stats is None:
+                return cell._call(), local.read
+            t0 = time.time()
+            value = cell._call()
+            stats.on_run(cell, time.time() - t0)
+            return value, local.read
+        finally:
+            local.read = outer
+
+    def _raise_height(self, cell, height):
+        # Move ``cell`` and everything depending on it above
+        # ``height``. Cells already on the path are skipped to stop on
+        # cycles.
+        path = set()
+        stack = [(cell, height)]
+        while stack:
+            cell, height = stack.pop()
+            if height is None:
+                # Everything depending on ``cell`` was visited.
+                path.remove(cell)
+                continue
+            if cell in path or cell._height > height:
+                continue
+            cell._height = height + 1
+            path.add(cell)
+            stack.append((cell, None))
+            for fun in self._links.get(cell, ()):
+                if isinstance(fun, ComputedCell):
+                    stack.append((fun, cell._height))
 
     def _register_read(self, obj):
         if self.cycle == 'running':
-            self._read.add( (obj, tuple()) )
+            read = self._read
+            if read is None:
+                read = self._local.read
+            read.add(obj)
 
     def subscribe(self, obj, fun, *args):
-        self._links[obj].add( (fun, args) )
-        self._rev_links[fun].add( (obj, args) )
+        self._links[obj].add( (fun, args) if args else fun )
+        self._rev_links[fun].add( (obj, args) if args else obj )
+        if self._stats is not None:
+            self._stats.on_subscribe(obj, fun)
 
     def unsubscribe(self, obj, fun, *args):
         dropped_objs = [obj]
 
         assert obj in self._links
         assert fun in self._rev_links
-        self._links[obj].remove( (fun, args) )
+        self._links[obj].remove( (fun, args) if args else fun )
         if not self._links[obj]:
             del self._links[obj]
-        self._rev_links[fun].remove( (obj, args) )
+        self._rev_links[fun].remove( (obj, args) if args else obj )
         if not self._rev_links[fun]:
             del self._rev_links[fun]
             dropped_objs.append(fun)
+        if self._stats is not None:
+            self._stats.on_unsubscribe(obj, fun)
 
         for obj in set(dropped_objs):
             if hasattr(obj, '_on_lost_reference'):
                 obj._on_lost_reference()
 
     def unsubscribe_all(self, obj):
+        self._queued.pop(obj, None)
+        self._applying.discard(obj)
         while obj in self._rev_links:
             funs = list(self._rev_links[obj])
             if len(funs) < 1:
                 print "ERROR: _rev_links desynchronized!"
                 break
-            fun, args = funs[0]
+            fun, args = _split(funs[0])
             self.unsubscribe(fun, obj, *args)
 
     def _fix_subscriptions(self, fun, new_subscribed):
-        old_subscribed = self._rev_links.get(fun, set())
-
-        for obj, args in new_subscribed - old_subscribed:
-            self.subscribe(obj, fun, *args)
-        for obj, args in old_subscribed - new_subscribed:
-            self.unsubscribe(obj, fun, *args)
+        old_subscribed = self._rev_links.get(fun, _empty)
+        if new_subscribed == old_subscribed:
+            # Read the same cells as the last time, the common case.
+            self._counters['subscriptions_unchanged'] += 1
+            return
+        self._counters['subscriptions_changed'] += 1
+
+        for obj in new_subscribed - old_subscribed:
+            self.subscribe(obj, fun)
+        for obj in old_subscribed - new_subscribed:
+            self.unsubscribe(obj, fun)
+
+        height = max([obj._height for obj in new_subscribed
+                      if obj is not fun] or [0])
+        if fun._height <= height:
+            self._raise_height(fun, height)
+        if fun._priority:
+            for obj in new_subscribed - old_subscribed:
+                if isinstance(obj, ComputedCell):
+                    self.set_priority(obj, fun._priority)
 
     def _w(self, ok_cycles, new_cycle):
-        o = self
-        ok_cycles = set(ok_cycles)
-        class controlled_execution:
-            def __enter__(self):
-                self.old_cycle = o.cycle
-                if self.old_cycle not in ok_cycles:
-                    raise Exception("Cycle %r is not in %r" % (self.old_cycle, ok_cycles))
-                # print "cycle = %r -> %r" % (self.old_cycle, new_cycle)
-                o.cycle = new_cycle
-
-            def __exit__(self, type, value, traceback):
-                # print "rcycle %r -> %r" % (o.cycle, self.old_cycle,)
-                o.cycle = self.old_cycle
-        return controlled_execution()
+        # Guards are stateless, one per transition is reused.
+        guard = self._guards.get((ok_cycles, new_cycle))
+        if guard is None:
+            guard = _Guard(self, ok_cycles, new_cycle)
+            self._guards[ok_cycles, new_cycle] = guard
+        return guard
+
+    def _refcount(self, obj):
+        # Number of subscribers of ``obj``, without copying them.
+        return len(self._links.get(obj, ()))
 
     def _referenced_by(self, obj):
         if obj in self._links:
-            return set(self._links[obj])
+            return set(_split(fun) for fun in self._links[obj])
         return set()
 
+    def set_stats(self, stats):
+        """ Report to ``stats``, a ``gatelogic.Stats`` or anything
+        with the same ``on_*`` hooks, how the changes propagate. None
+        stops reporting. Return the previous one. """
+        old, self._stats = self._stats, stats
+        return old
+
+    def nodes(self):
+        """ Iterate over the objects of the dependency graph: cells,
+        hubs and subscribed functions. """
+        for obj in self._links:
+            yield obj
+        seen = set()
+        for fun in self._rev_links:
+            node = _node(fun)
+            if node not in self._links and node not in seen:
+                seen.add(node)
+                yield node
+
+    def edges(self):
+        """ Iterate over the dependency graph as ``(obj, subscriber,
+        args)`` triples, ``subscriber`` is notified of the changes of
+        ``obj``. Don't change the graph while iterating. """
+        for obj, funs in self._links.iteritems():
+            for entry in funs:
+                fun, args = _split(entry)
+                yield obj, _node(fun), args
+
+    def snapshot(self, fname, hubs):
+        """ Save the hubs in ``hubs``, a dictionary of names to hubs,
+        to the file ``fname``: their values and ``extra``, and for
+        ComputedCells the value and the cells it was computed from.
+
+        Cells reading cells outside of the given hubs aren't saved. """
+        self._restored.clear()
+        names = {}
+        for name, hub in hubs.iteritems():
+            for key, cell in hub._ns.iteritems():
+                names[cell] = (name, key)
+        state = dict((name, hub._save(names))
+                     for name, hub in hubs.iteritems())
+
+        dirname = os.path.dirname(os.path.abspath(fname))
+        fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                cPickle.dump((_SNAPSHOT_VERSION, state), f, 2)
+            os.rename(tmp, fname)
+        except:
+            os.unlink(tmp)
+            raise
+
+    def restore(self, fname, hubs):
+        """ Load a file written by ``snapshot()`` into ``hubs``, given
+        under the same names, before maintaining any ComputedCell.
+
+        Hubs get their saved values back. ComputedCells maintained
+        later under a saved key, with a function of the same name, take
+        the saved value without running if the cells they were computed
+        from still hold the same values. Otherwise they run as usual.
+        """
+        with open(fname, 'rb') as f:
+            version, state = cPickle.load(f)
+        if version != _SNAPSHOT_VERSION:
+            raise ValueError("%r: unsupported snapshot version %r" %
+                             (fname, version))
+        with self.batch():
+            for name, hub in hubs.iteritems():
+                if name in state:
+                    hub._load(state[name], hubs)
+
+    def _restore(self, hub, key, cell):
+        # Give ``cell`` its saved value and inputs, if still valid.
+        entry = self._restored.pop((hub, key), None)
+        if entry is None:
+            return False
+        name, value, inputs = entry
+        if getattr(cell._fun[0], '__name__', None) != name:
+            return False
+        for dep_hub, k, v in inputs:
+            if dep_hub._peek(k) != v:
+                return False
+
+        cell._value = value
+        self._fix_subscriptions(cell, set(dep_hub._input(k)
+                                          for dep_hub, k, _ in inputs))
+        cell._verified = self._clock
+        self._counters['cells_restored'] += 1
+        return True
+
+    def counters(self):
+        """ Return a dictionary with the counts of internal events. """
+        return dict(self._counters)
+
     def is_empty(self):
         return not bool(self._links)
@@ -0,0 +1,132 @@
+import gatelogic
+import unittest
+
+
+class TestAggregate(unittest.TestCase):
+    def test_group_by(self):
+        c = gatelogic.Controller()
+        signals = gatelogic.ReadableHub(c)
+        mitigations = gatelogic.ComputableHub(c)
+        limits = gatelogic.ComputableHub(c)
+
+        def action(row):
+            customer, level = row.value
+            return (customer, level) if level > 1 else None
+
+        mitigations.map_from(signals, action)
+        signals.update({'a': ('c1', 2), 'b': ('c1', 3), 'c': ('c2', 1)})
+
+        active = gatelogic.Aggregate(
+            mitigations, gatelogic.Count(),
+            group=lambda key, value: value and value[0])
+        worst = gatelogic.Aggregate(
+            mitigations, gatelogic.Max(),
+            value=lambda key, value: value and value[1])
+        self.assertEqual(active.dump(), {'c1': 2})
+        self.assertEqual(worst.get().value, 3)
+
+        runs = []
+        def limit(customer):
+            runs.append(customer)
+            return active.get(customer).value < 2
+
+        limits.maintain('c1', limit, 'c1')
+        limits.maintain('c2', limit, 'c2')
+        self.assertEqual(limits.dump(), {'c1': False, 'c2': True})
+
+        del runs[:]
+        signals.update({'a': ('c1', 2), 'b': ('c1', 0), 'c': ('c2', 5)})
+        self.assertEqual(sorted(runs), ['c1', 'c2'])
+        self.assertEqual(active.dump(), {'c1': 1, 'c2': 1})
+        self.assertEqual(worst.get().value, 5)
+
+        del runs[:]
+        signals.update({'a': ('c1', 2), 'c': ('c2', 5), 'd': ('c2', 7)})
+        self.assertEqual(runs, ['c2'])
+        self.assertEqual(limits.dump(), {'c1': True, 'c2': False})
+
+        limits.unmaintain('c1')
+        limits.unmaintain('c2')
+        active.close()
+        worst.close()
+        mitigations.unmap_from(signals)
+        signals.update({})
+        self.assertTrue(c.is_empty())
+
+    def test_reducer(self):
+        c = gatelogic.Controller()
+        hub = gatelogic.ReadableHub(c)
+        hub.update({'a': 1, 'b': 2})
+
+        keys = gatelogic.Aggregate(hub, gatelogic.Reducer(
+            lambda state, value: state | frozenset([value]),
+            lambda state, value: state - frozenset([value]),
+            frozenset()), value=lambda key, value: key)
+        total = gatelogic.Aggregate(hub, gatelogic.Sum())
+        lowest = gatelogic.Aggregate(hub, gatelogic.Min())
+
+        hub.apply_delta(added={'c': 0}, changed={'a': 5}, removed=['b'])
+        self.assertEqual(keys.get().value, frozenset(['a', 'c']))
+        self.assertEqual(total.get().value, 5)
+        self.assertEqual(lowest.get().value, 0)
+        hub.update({})
+        self.assertEqual(lowest.get().value, None)
+        self.assertEqual(total.dump(), {})
+
+
+    def test_map_from(self):
+        c = gatelogic.Controller()
+        signals = gatelogic.ReadableHub(c)
+        doubled = gatelogic.ComputableHub(c)
+        lazy = gatelogic.LazyComputableHub(c)
+        doubled.map_from(signals, lambda row: row.value * 2)
+        lazy.map_from(signals, lambda row: row.value)
+
+        # cells added by map_from() count once computed
+        total = gatelogic.Aggregate(doubled, gatelogic.Sum())
+        count = gatelogic.Aggregate(lazy, gatelogic.Count())
+        signals.update({'a': 1, 'b': 2})
+        self.assertEqual(total.get().value, 6)
+        self.assertEqual(count.get().value, 0)
+        lazy.dump()
+        self.assertEqual(count.get().value, 2)
+
+        signals.update({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(total.get().value, 12)
+        signals.update({'c': 3})
+        self.assertEqual(total.get().value, 6)
+        lazy.dump()
+        self.assertEqual(count.get().value, 1)
+
+        total.close()
+        count.close()
+        doubled.unmap_from(signals)
+        lazy.unmap_from(signals)
+        signals.update({})
+        self.assertTrue(c.is_empty())
+
+    def test_query_hub(self):
+        c = gatelogic.Controller()
+        q = gatelogic.QueryHub(c)
+        egress = gatelogic.ComputableHub(c)
+        q.update({'x1': 1, 'x2': 2})
+        total = gatelogic.Aggregate(q, gatelogic.Sum())
+
+        # keys created by get() within a computation update the result
+        egress.maintain('total', lambda: total.get().value)
+        egress.maintain('x1', lambda: q.get('x1').value)
+        self.assertEqual(egress.get('total').value, 1)
+        egress.maintain('x2', lambda: q.get('x2').value)
+        self.assertEqual(egress.get('total').value, 3)
+
+        q.update({'x1': 3, 'x2': 5})
+        self.assertEqual(egress.get('total').value, 8)
+
+        for k in ('total', 'x1', 'x2'):
+            egress.unmaintain(k)
+        total.close()
+        q.update({})
+        self.assertTrue(c.is_empty())
+
+if __name__ == '__main__':
+    unittest.main()
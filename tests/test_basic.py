@@ -1,5 +1,7 @@
 import gatelogic
+import multiprocessing.pool
 import os
+import threading
 import unittest
 
 
@@ -275,3 +277,568 @@ class TestBasic(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             hub.get('1').value = 41
 
+    def test_batch(self):
+        c = gatelogic.Controller()
+
+        egress = gatelogic.ComputableHub(c)
+        hub = gatelogic.QueryHub(c)
+
+        counter = [0]
+
+        def action():
+            counter[0] += 1
+            return (hub.get('a').value or 0) + (hub.get('b').value or 0)
+
+        egress.maintain('1', action)
+        self.assertEqual(counter[0], 1)
+
+        with c.batch():
+            hub.get('a').value = 1
+            hub.get('b').value = 2
+            self.assertEqual(counter[0], 1)
+        self.assertEqual(counter[0], 2)
+        self.assertEqual(egress.get('1').value, 3)
+
+        hub.update({'a': 10, 'b': 20})
+        self.assertEqual(counter[0], 3)
+        self.assertEqual(egress.get('1').value, 30)
+
+        with c.transaction():
+            hub.update({'a': 1})
+            hub.update({'b': 1})
+        self.assertEqual(counter[0], 4)
+        self.assertEqual(egress.get('1').value, 2)
+
+        egress.unmaintain('1')
+        self.assertTrue(c.is_empty())
+
+    def test_batch_unmaintain(self):
+        c = gatelogic.Controller()
+
+        egress = gatelogic.ComputableHub(c)
+        hub = gatelogic.QueryHub(c)
+
+        def action():
+            return hub.get('a').value
+
+        egress.maintain('1', action)
+        with c.batch():
+            hub.get('a').value = 1
+            egress.unmaintain('1')
+        self.assertTrue(c.is_empty())
+
+    def test_glitch_free(self):
+        c = gatelogic.Controller()
+
+        hub = gatelogic.ReadableHub(c)
+        mid = gatelogic.ComputableHub(c)
+        egress = gatelogic.ComputableHub(c)
+        hub.update({'a': 1})
+
+        seen = []
+
+        def double():
+            return hub.get('a').value * 2
+
+        def plus(n):
+            return hub.get('a').value + n
+
+        def total():
+            v = (mid.get('b').value, mid.get('c').value, egress.get('d').value)
+            seen.append(v)
+            return sum(v)
+
+        mid.maintain('b', double)
+        egress.maintain('d', plus, 1)
+        mid.maintain('c', plus, 2)
+        egress.maintain('e', total)
+        self.assertEqual(seen, [(2, 3, 2)])
+
+        hub.update({'a': 10})
+        self.assertEqual(seen, [(2, 3, 2), (20, 12, 11)])
+        self.assertEqual(egress.get('e').value, 43)
+
+    def test_deep_chain(self):
+        c = gatelogic.Controller()
+
+        hub = gatelogic.ReadableHub(c)
+        chain = gatelogic.ComputableHub(c)
+        hub.update({'x': 0})
+
+        counter = [0]
+
+        def action(i):
+            counter[0] += 1
+            if i == 0:
+                return hub.get('x').value
+            return chain.get(i - 1).value + 1
+
+        for i in range(2000):
+            chain.maintain(i, action, i)
+        self.assertEqual(counter[0], 2000)
+        self.assertEqual(chain.get(1999).value, 1999)
+
+        hub.update({'x': 1})
+        self.assertEqual(counter[0], 4000)
+        self.assertEqual(chain.get(1999).value, 2000)
+
+    def test_apply_delta(self):
+        c = gatelogic.Controller()
+
+        hub = gatelogic.ReadableHub(c)
+        hub.update({1: 1, 2: 2, 3: 3}, {'serial': 1})
+
+        events = []
+        def on_event(_, kind, key, _cell):
+            events.append((kind, key))
+        c.subscribe(hub, on_event)
+
+        hub.apply_delta(added={4: 4}, changed={1: 10, 2: 2}, removed=[3, 5])
+        self.assertEqual(hub.dump(), {1: 10, 2: 2, 4: 4})
+        self.assertEqual(sorted(events), [('add', 4), ('delete', 3), ('set', 1)])
+        self.assertEqual(hub.extra, {'serial': 1})
+
+        del events[:]
+        hub.patch([('set', 2, 20), ('delete', 1, None), ('add', 1, 1)],
+                  extra={'serial': 2})
+        self.assertEqual(hub.dump(), {1: 1, 2: 20, 4: 4})
+        self.assertEqual(events, [('set', 2), ('delete', 1), ('add', 1)])
+        self.assertEqual(hub.extra, {'serial': 2})
+
+        c.unsubscribe(hub, on_event)
+        hub.update({})
+        self.assertTrue(c.is_empty())
+
+    def test_query_apply_delta(self):
+        c = gatelogic.Controller()
+
+        egress = gatelogic.ComputableHub(c)
+        hub = gatelogic.QueryHub(c)
+
+        def action():
+            return hub.get('item').value
+
+        egress.maintain('1', action)
+        hub.apply_delta(added={'item': 1, 'other': 2})
+        self.assertEqual(hub.keys(), ['item'])
+        self.assertEqual(egress.get('1').value, 1)
+
+        hub.patch([('set', 'item', 3), ('delete', 'other', None)])
+        self.assertEqual(egress.get('1').value, 3)
+        with self.assertRaises(KeyError):
+            hub.get('other')
+
+        egress.unmaintain('1')
+        self.assertTrue(c.is_empty())
+
+    def test_compact_cells(self):
+        c = gatelogic.Controller()
+
+        egress = gatelogic.ComputableHub(c)
+        hub = gatelogic.QueryHub(c)
+
+        def action():
+            return hub.get('item').value
+
+        cell = egress.maintain('1', action)
+        self.assertFalse(hasattr(cell, '__dict__'))
+        self.assertFalse(hasattr(hub.get('item'), '__dict__'))
+        self.assertTrue(cell._id < hub.get('item')._id)
+
+        # edges between cells are stored without argument tuples
+        self.assertEqual(c._links[hub.get('item')],
+                         set([cell, (hub._on_change, ('item',))]))
+        self.assertEqual(c._rev_links[cell], set([hub.get('item')]))
+        self.assertEqual(c._referenced_by(hub.get('item')),
+                         set([(cell, ()), (hub._on_change, ('item',))]))
+
+    def test_batch_error(self):
+        c = gatelogic.Controller()
+        hub = gatelogic.ReadableHub(c)
+        egress = gatelogic.ComputableHub(c)
+        hub.update({'x': 1})
+
+        def action():
+            if hub.get('x').value == 2:
+                raise ValueError('rule')
+            return hub.get('x').value
+
+        egress.maintain('1', action)
+
+        # the caller's error comes out, not the rule's
+        with self.assertRaises(KeyError):
+            with c.batch():
+                hub.update({'x': 2})
+                raise KeyError('original')
+        self.assertEqual(c.pending(), 1)
+
+        hub.update({'x': 3})
+        self.assertEqual(c.pending(), 0)
+        self.assertEqual(egress.get('1').value, 3)
+
+    def test_query_retain(self):
+        c = gatelogic.Controller()
+
+        egress = gatelogic.ComputableHub(c)
+        shift_hub = gatelogic.ReadableHub(c)
+        hub = gatelogic.QueryHub(c, retain=2)
+        shift_hub.update({'shift': 0})
+
+        def action():
+            return hub.get(shift_hub.get('shift').value).value
+
+        egress.maintain('1', action)
+        self.assertEqual(c._refcount(hub.get(0)), 2)
+        events = []
+        c.subscribe(hub, lambda _, kind, k, _v: events.append((kind, k)))
+
+        # dropped keys are retained, flapping back doesn't recreate them
+        shift_hub.update({'shift': 1})
+        shift_hub.update({'shift': 0})
+        self.assertEqual(events, [('add', 1)])
+        self.assertEqual(sorted(hub.keys()), [0, 1])
+
+        # only the 2 most recently dropped keys are kept
+        for i in range(2, 5):
+            shift_hub.update({'shift': i})
+        self.assertEqual(sorted(hub.keys()), [2, 3, 4])
+        self.assertEqual([e for e in events if e[0] == 'delete'],
+                         [('delete', 1), ('delete', 0)])
+
+        egress.unmaintain('1')
+        self.assertEqual(sorted(hub.keys()), [3, 4])
+
+    def test_priority(self):
+        c = gatelogic.Controller()
+        signals = gatelogic.ReadableHub(c)
+        kill_hub = gatelogic.ReadableHub(c)
+        mitigations = gatelogic.ComputableHub(c)
+        kill = gatelogic.ComputableHub(c)
+        kill.set_priority(10)
+        signals.update(dict((i, i) for i in range(5)))
+        kill_hub.update({'switch': False})
+
+        runs = []
+        def action(row):
+            runs.append(row.value)
+            return row.value
+        def enabled():
+            runs.append('kill')
+            return not kill_hub.get('switch').value
+
+        mitigations.map_from(signals, action)
+        kill.maintain('enabled', enabled)
+
+        del runs[:]
+        with c.batch():
+            signals.update(dict((i, i + 1) for i in range(5)))
+            kill_hub.update({'switch': True})
+        self.assertEqual(runs[0], 'kill')
+        self.assertEqual(len(runs), 6)
+
+        # one cell per slice, the rest waits
+        c.budget = 0
+        flushed = []
+        sink = gatelogic.Sink(mitigations, flushed.append)
+        signals.update(dict((i, i + 2) for i in range(5)))
+        self.assertEqual(c.pending(), 4)
+        self.assertEqual(flushed, [])
+        # urgent work goes first
+        del runs[:]
+        kill_hub.update({'switch': False})
+        self.assertEqual(runs, ['kill'])
+        while c.pending():
+            c.resume()
+        self.assertEqual(len(runs), 5)
+        self.assertEqual(flushed, [dict((i, i + 2) for i in range(5))])
+        sink.close()
+
+        # rules waiting for a slice move up with the kill switch
+        guarded = gatelogic.ComputableHub(c)
+        def guard(row):
+            runs.append('guard')
+            return kill.get('enabled').value and row.value
+        guarded.map_from(signals, guard)
+        signals.update(dict((i, i + 3) for i in range(5)))
+        while c.pending():
+            c.resume()
+        signals.update(dict((i, i + 4) for i in range(5)))
+        self.assertEqual(c.pending(), 9)
+        del runs[:]
+        kill_hub.update({'switch': True})
+        while c.pending():
+            c.resume()
+        self.assertEqual(runs, ['kill'] + ['guard'] * 5 + [5, 6, 7, 8])
+        self.assertEqual(guarded.dump(), dict((i, False) for i in range(5)))
+
+        # and so do the ones raised by set_priority()
+        kill_hub.update({'switch': False})
+        while c.pending():
+            c.resume()
+        signals.update(dict((i, i + 5) for i in range(5)))
+        del runs[:]
+        guarded.set_priority(20)
+        while c.pending():
+            c.resume()
+        self.assertEqual(runs, ['guard'] * 5 + [6, 7, 8, 9])
+
+    def test_subscriptions_fast_path(self):
+        c = gatelogic.Controller()
+
+        egress = gatelogic.ComputableHub(c)
+        hub = gatelogic.QueryHub(c)
+
+        def action():
+            if hub.get('one').value:
+                return hub.get('two').value
+            return None
+
+        def subscriptions():
+            return dict((k, v) for k, v in c.counters().iteritems()
+                        if k.startswith('subscriptions_'))
+
+        egress.maintain('1', action)
+        self.assertEqual(subscriptions(), {'subscriptions_changed': 1})
+
+        hub.get('one').value = True
+        self.assertEqual(subscriptions(), {'subscriptions_changed': 2})
+
+        hub.get('two').value = 'x'
+        hub.get('two').value = 'y'
+        self.assertEqual(subscriptions(), {'subscriptions_changed': 2,
+                                           'subscriptions_unchanged': 2})
+        self.assertEqual(egress.get('1').value, 'y')
+
+    def test_memoized(self):
+        c = gatelogic.Controller()
+
+        mid = gatelogic.ComputableHub(c)
+        egress = gatelogic.ComputableHub(c)
+        hub = gatelogic.QueryHub(c)
+
+        counter = [0, 0]
+
+        def parity():
+            counter[0] += 1
+            return (hub.get('item').value or 0) % 2
+
+        def action():
+            counter[1] += 1
+            return 'odd' if mid.get('1').value else 'even'
+
+        mid.maintain('1', parity)
+        egress.maintain('2', action)
+        self.assertEqual(counter, [1, 1])
+
+        # inputs didn't change, the function is not called
+        with c._w( (None,), 'update'):
+            mid.get('1')._run()
+        self.assertEqual(counter, [1, 1])
+        self.assertEqual(c.counters()['runs_skipped'], 1)
+
+        hub.get('item').value = 1
+        self.assertEqual(counter, [2, 2])
+        self.assertEqual(egress.get('2').value, 'odd')
+
+        # same parity, propagation stops at the first layer
+        hub.get('item').value = 3
+        self.assertEqual(counter, [3, 2])
+        self.assertEqual(egress.get('2').value, 'odd')
+
+    def test_lazy(self):
+        c = gatelogic.Controller()
+
+        hub = gatelogic.ReadableHub(c)
+        lazy = gatelogic.LazyComputableHub(c)
+        egress = gatelogic.ComputableHub(c)
+        hub.update({'a': 1})
+
+        counter = [0]
+
+        def action():
+            counter[0] += 1
+            return hub.get('a').value * 10
+
+        lazy.maintain('1', action)
+        self.assertEqual(counter[0], 0)
+
+        self.assertEqual(lazy.dump(), {'1': 10})
+        self.assertEqual(lazy.get('1').value, 10)
+        self.assertEqual(counter[0], 1)
+
+        hub.update({'a': 2})
+        hub.update({'a': 3})
+        self.assertEqual(counter[0], 1)
+        self.assertEqual(lazy.get('1').value, 30)
+        self.assertEqual(counter[0], 2)
+
+        # read by an eager cell, kept up to date
+        def action2():
+            return lazy.get('1').value + 1
+
+        egress.maintain('2', action2)
+        self.assertEqual(egress.get('2').value, 31)
+        hub.update({'a': 4})
+        self.assertEqual(counter[0], 3)
+        self.assertEqual(egress.get('2').value, 41)
+
+        egress.unmaintain('2')
+        hub.update({'a': 5})
+        self.assertEqual(counter[0], 3)
+
+        lazy.unmaintain('1')
+        hub.update({})
+        self.assertTrue(c.is_empty())
+
+    def test_parallel(self):
+        pool = multiprocessing.pool.ThreadPool(4)
+        c = gatelogic.Controller(executor=pool)
+
+        signals = gatelogic.ReadableHub(c)
+        toggle_hub = gatelogic.QueryHub(c)
+        plan_hub = gatelogic.QueryHub(c)
+        mitigations = gatelogic.ComputableHub(c)
+        lazy = gatelogic.LazyComputableHub(c)
+        total = gatelogic.ComputableHub(c)
+
+        threads = set()
+
+        def suffix():
+            return plan_hub.get('suffix').value or ''
+
+        def action(row):
+            threads.add(threading.current_thread().name)
+            if toggle_hub.get('enabled').value != 'True':
+                return None
+            return row.value + lazy.get('suffix').value + \
+                (plan_hub.get(row.value).value or '')
+
+        def on_new(_, kind, k, row):
+            if kind == 'add':
+                mitigations.maintain(k, action, row)
+            if kind == 'delete':
+                mitigations.unmaintain(k)
+        c.subscribe(signals, on_new)
+
+        lazy.maintain('suffix', suffix)
+        signals.update(dict((i, 'd%d' % i) for i in range(50)))
+        toggle_hub.update({'enabled': 'True', 'other': 'x'})
+        total.maintain('count', lambda: len([k for k in mitigations.keys()
+                                             if mitigations.get(k).value]))
+
+        self.assertEqual(total.get('count').value, 50)
+        self.assertEqual(mitigations.get(7).value, 'd7')
+        self.assertTrue(len(threads) > 1)
+        self.assertEqual(sorted(plan_hub.keys()),
+                         sorted(['suffix'] + ['d%d' % i for i in range(50)]))
+
+        plan_hub.update({'suffix': '.com', 'd7': ' --qps=500'})
+        self.assertEqual(mitigations.get(7).value, 'd7.com --qps=500')
+        self.assertEqual(mitigations.get(8).value, 'd8.com')
+
+        # B starts reading its sibling A, computed at the same time
+        siblings = gatelogic.ComputableHub(c)
+        def a():
+            return toggle_hub.get('other').value == 'y' and 10 or 0
+        def b():
+            if toggle_hub.get('other').value != 'y':
+                return None
+            return ('A', siblings.get('A').value)
+        siblings.maintain('A', a)
+        siblings.maintain('B', b)
+        toggle_hub.update({'enabled': 'True', 'other': 'y'})
+        self.assertEqual(siblings.get('B').value, ('A', 10))
+        siblings.unmaintain('B')
+        siblings.unmaintain('A')
+
+        c.unsubscribe(signals, on_new)
+        for k in mitigations.keys():
+            mitigations.unmaintain(k)
+        total.unmaintain('count')
+        lazy.unmaintain('suffix')
+        signals.update({})
+        self.assertTrue(c.is_empty())
+        pool.close()
+
+    def test_maintain_many(self):
+        c = gatelogic.Controller()
+
+        hub = gatelogic.QueryHub(c)
+        egress = gatelogic.ComputableHub(c)
+        counter = [0]
+
+        def action(n):
+            counter[0] += 1
+            return '%s-%s' % (n, hub.get('suffix').value)
+
+        egress.maintain_many((i, action, i) for i in range(100))
+        self.assertEqual(counter[0], 100)
+        self.assertEqual(egress.get(5).value, '5-None')
+
+        hub.get('suffix').value = 'x'
+        self.assertEqual(counter[0], 200)
+        self.assertEqual(egress.get(5).value, '5-x')
+
+        with self.assertRaises(KeyError):
+            egress.maintain_many([(5, action, 5)])
+
+    def test_map_from(self):
+        c = gatelogic.Controller()
+
+        signals = gatelogic.ReadableHub(c)
+        mitigations = gatelogic.ComputableHub(c)
+        signals.update({1: 'a', 2: 'b'})
+
+        counter = [0]
+        flushed = []
+
+        def action(row, suffix):
+            counter[0] += 1
+            return row.value + suffix
+
+        mitigations.map_from(signals, action, '.com')
+        self.assertEqual(mitigations.dump(), {1: 'a.com', 2: 'b.com'})
+        sink = gatelogic.Sink(mitigations, flushed.append)
+
+        signals.update(dict((i, str(i)) for i in range(1, 1001)))
+        self.assertEqual(counter[0], 1002)
+        self.assertEqual(len(flushed), 1)
+        self.assertEqual(mitigations.get(1).value, '1.com')
+        self.assertEqual(mitigations.get(1000).value, '1000.com')
+
+        signals.update({1: 'x', 5: '5'})
+        self.assertEqual(mitigations.dump(), {1: 'x.com', 5: '5.com'})
+
+        mitigations.unmap_from(signals)
+        self.assertEqual(mitigations.dump(), {})
+        sink.close()
+        signals.update({})
+        self.assertTrue(c.is_empty())
+
+    def test_map_from_query_hub(self):
+        c = gatelogic.Controller()
+        signals = gatelogic.ReadableHub(c)
+        q = gatelogic.QueryHub(c)
+        derived = gatelogic.ComputableHub(c)
+        egress = gatelogic.ComputableHub(c)
+        signals.update({'a': 'x'})
+        q.update({'x': 1, 'y': 2})
+
+        # keys created by get() within a computation are mapped too
+        derived.map_from(q, lambda row: row.value * 10)
+        egress.maintain('r', lambda: q.get(signals.get('a').value).value)
+        self.assertEqual(egress.get('r').value, 1)
+        self.assertEqual(derived.dump(), {'x': 10})
+
+        signals.update({'a': 'y'})
+        self.assertEqual(egress.get('r').value, 2)
+        self.assertEqual(derived.get('y').value, 20)
+        q.update({'x': 3, 'y': 4})
+        self.assertEqual(derived.get('y').value, 40)
+
+        egress.unmaintain('r')
+        derived.unmap_from(q)
+        self.assertEqual(derived.dump(), {})
+        q.update({})
+        signals.update({})
+        self.assertTrue(c.is_empty())
@@ -0,0 +1,68 @@
+import gatelogic
+import sys
+import time
+import unittest
+
+
+def legacy_w(o, ok_cycles, new_cycle):
+    # Controller._w as it was, building a class on every call.
+    ok_cycles = set(ok_cycles)
+    class controlled_execution:
+        def __enter__(self):
+            self.old_cycle = o.cycle
+            if self.old_cycle not in ok_cycles:
+                raise Exception("Cycle %r is not in %r" % (self.old_cycle, ok_cycles))
+            o.cycle = new_cycle
+
+        def __exit__(self, type, value, traceback):
+            o.cycle = self.old_cycle
+    return controlled_execution()
+
+
+def per_op(fun, n, repeat=3):
+    best = None
+    for _ in xrange(repeat):
+        t0 = time.time()
+        fun(n)
+        t = (time.time() - t0) / n * 1e6
+        best = t if best is None else min(best, t)
+    return best
+
+
+class TestBench(unittest.TestCase):
+    """ Microbenchmarks, printing the overhead per operation. """
+
+    def measure(self, c):
+        hub = gatelogic.ReadableHub(c)
+        egress = gatelogic.ComputableHub(c)
+        hub.update({'a': 0})
+        cell = egress.maintain('1', lambda: hub.get('a').value)
+
+        def guard(n):
+            for i in xrange(n):
+                with c._w( (None, 'update'), 'update'):
+                    pass
+
+        def set_values(n):
+            row = hub.get('a')
+            for i in xrange(n):
+                row.value = -i
+
+        def run(n):
+            with c._w( (None,), 'update'):
+                for i in xrange(n):
+                    cell._verified = None
+                    cell._run()
+
+        return [per_op(f, 10000) for f in (guard, set_values, run)]
+
+    def test_cycle_guard(self):
+        old = gatelogic.Controller()
+        old._w = legacy_w.__get__(old)
+        new = gatelogic.Controller()
+        self.assertTrue(new._w( (None,), 'update') is new._w( (None,), 'update'))
+
+        results = zip(self.measure(old), self.measure(new))
+        print >> sys.stderr, "\n  guard: %.2fus -> %.2fus, " \
+            "set: %.2fus -> %.2fus, run: %.2fus -> %.2fus" % (
+                sum(results, ())),
@@ -0,0 +1,106 @@
+import gatelogic
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestFiles(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def write(self, name, data, mode='wb'):
+        with open(self.path(name), mode) as fd:
+            fd.write(data)
+
+    def read(self, name):
+        with open(self.path(name), 'rb') as fd:
+            return fd.read()
+
+    def test_snapshot(self):
+        c = gatelogic.Controller()
+        signals = gatelogic.FileReadableHub(c, self.path('signals.txt'))
+        confirm_hub = gatelogic.FileQueryHub(c, self.path('confirms_sub.txt'),
+                                             self.path('confirms_res.txt'))
+        mitigations = gatelogic.FileComputableHub(c, self.path('out.txt'))
+
+        def action(row):
+            if confirm_hub.get('enabled').value != 'True':
+                return None
+            return row.value
+
+        def on_new(_, kind, k, row):
+            if kind == 'add':
+                mitigations.maintain(k, action, row)
+            if kind == 'delete':
+                mitigations.unmaintain(k)
+        c.subscribe(signals, on_new)
+
+        signals.poll()
+        self.assertEqual(signals.dump(), {})
+
+        self.write('signals.txt', '1 example.com\n2 flooded.com')
+        signals.poll()
+        self.assertEqual(signals.dump(), {'1': 'example.com',
+                                          '2': 'flooded.com'})
+        self.assertEqual(self.read('out.txt'), '1 None\n2 None\n')
+        self.assertEqual(self.read('confirms_sub.txt'), 'enabled None\n')
+
+        self.write('confirms_res.txt', 'enabled True\n')
+        confirm_hub.poll()
+        self.assertEqual(self.read('out.txt'),
+                         '1 example.com\n2 flooded.com\n')
+
+        # unchanged file isn't parsed again
+        signals.update({})
+        signals.poll()
+        self.assertEqual(signals.dump(), {})
+        self.assertEqual(self.read('out.txt'), '')
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         ['confirms_res.txt', 'confirms_sub.txt', 'out.txt',
+                          'signals.txt'])
+
+    def test_log(self):
+        c = gatelogic.Controller()
+        signals = gatelogic.FileReadableHub(c, self.path('signals.log'),
+                                            log=True)
+        mitigations = gatelogic.FileComputableHub(c, self.path('out.log'),
+                                                  log=True)
+
+        def on_new(_, kind, k, row):
+            if kind == 'add':
+                mitigations.maintain(k, lambda: row.value.upper())
+            if kind == 'delete':
+                mitigations.unmaintain(k)
+        c.subscribe(signals, on_new)
+
+        events = []
+        c.subscribe(signals, lambda _h, kind, k, _v: events.append((kind, k)))
+
+        self.write('signals.log', 'a x\nb y\na z\n')
+        signals.poll()
+        self.assertEqual(signals.dump(), {'a': 'z', 'b': 'y'})
+        self.assertEqual(self.read('out.log'), 'a Z\nb Y\n')
+
+        del events[:]
+        self.write('signals.log', 'b\nc w\nd', 'ab')
+        signals.poll()
+        self.assertEqual(signals.dump(), {'a': 'z', 'c': 'w'})
+        self.assertEqual(sorted(events), [('add', 'c'), ('delete', 'b')])
+        self.assertEqual(self.read('out.log'), 'a Z\nb Y\nb\nc W\n')
+
+        self.write('signals.log', ' v\n', 'ab')
+        signals.poll()
+        self.assertEqual(signals.dump(), {'a': 'z', 'c': 'w', 'd': 'v'})
+
+        # rotated log is read from the start
+        os.unlink(self.path('signals.log'))
+        self.write('signals.log', 'e u\n')
+        signals.poll()
+        self.assertEqual(signals.dump(), {'e': 'u'})
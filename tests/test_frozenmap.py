@@ -0,0 +1,51 @@
+import gatelogic
+from gatelogic.frozenmap import FrozenMap
+import unittest
+
+
+class TestFrozenMap(unittest.TestCase):
+    def test_evolve(self):
+        a = FrozenMap({1: 'a', 2: 'b'})
+        b = a.evolve([('set', 1, 'x'), ('add', 3, 'c'), ('delete', 2, None),
+                      ('delete', 4, None)])
+
+        self.assertEqual(dict(a), {1: 'a', 2: 'b'})
+        self.assertEqual(dict(b), {1: 'x', 3: 'c'})
+        self.assertEqual(len(b), 2)
+        self.assertEqual((a.version, b.version), (0, 1))
+        self.assertTrue(2 not in b)
+        self.assertEqual(b.get(2, 'missing'), 'missing')
+        with self.assertRaises(KeyError):
+            b[2]
+
+    def test_sharing(self):
+        value = ['not', 'copied']
+        a = FrozenMap((i, value) for i in xrange(1000))
+        b = a.evolve([('set', 0, None)])
+
+        self.assertTrue(a[1] is value)
+        self.assertTrue(b[1] is value)
+        shared = sum(1 for x, y in zip(a._buckets, b._buckets) if x is y)
+        self.assertEqual(shared, len(a._buckets) - 1)
+
+    def test_grow(self):
+        m = FrozenMap()
+        for i in xrange(5000):
+            m = m.evolve([('add', i, i)])
+        self.assertEqual(len(m), 5000)
+        self.assertEqual(m.version, 5000)
+        self.assertEqual(dict(m), dict((i, i) for i in xrange(5000)))
+        self.assertTrue(len(m._buckets) > FrozenMap._min_width)
+
+    def test_query_hub(self):
+        c = gatelogic.Controller()
+        hub = gatelogic.QueryHub(c)
+
+        data = {'item': 'x'}
+        hub.update(data)
+        data['item'] = 'y'
+        self.assertEqual(hub.get('item').value, 'x')
+
+        hub.apply_delta(changed={'item': 'z'})
+        self.assertEqual(hub._last_data.version, 2)
+        self.assertEqual(hub.get('item').value, 'z')
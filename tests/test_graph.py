@@ -0,0 +1,69 @@
+import gatelogic
+import json
+import StringIO
+import unittest
+
+from gatelogic import graph
+
+
+class TestGraph(unittest.TestCase):
+    def setUp(self):
+        c = self.c = gatelogic.Controller()
+        self.toggle_hub = gatelogic.ReadableHub(c)
+        self.mitigations = gatelogic.ComputableHub(c)
+        self.toggle_hub.update({'enabled': 'True', 'other': 'x'})
+
+        def action(i):
+            if self.toggle_hub.get('enabled').value != 'True':
+                return None
+            return i
+
+        for i in range(10):
+            self.mitigations.maintain(i, action, i)
+
+    def tearDown(self):
+        for i in range(10):
+            self.mitigations.unmaintain(i)
+        self.toggle_hub.update({})
+        self.assertTrue(self.c.is_empty())
+
+    def test_edges(self):
+        toggle = self.toggle_hub.get('enabled')
+        edges = list(self.c.edges())
+        # every cell is followed by its hub, the toggle by 10 cells
+        self.assertEqual(len(edges), 2 + 10 + 10)
+        self.assertIn((toggle, self.toggle_hub, ('enabled',)), edges)
+        nodes = list(self.c.nodes())
+        self.assertEqual(len(nodes), len(set(nodes)))
+        self.assertEqual(len(nodes), 2 + 10 + 2)
+
+    def test_analysis(self):
+        toggle = self.toggle_hub.get('enabled')
+        fan_in, fan_out = graph.distribution(self.c)
+        self.assertEqual(fan_out[11], 1)
+        self.assertEqual(fan_in[10], 1)
+        self.assertEqual(sum(fan_out.values()), 14)
+
+        top = graph.largest_closures(self.c, 2)
+        # the 10 cells and both hubs
+        self.assertEqual(top[0], (12, toggle))
+        self.assertEqual(graph.downstream(self.c, toggle),
+                         set(self.mitigations._ns.values()) |
+                         set([self.toggle_hub, self.mitigations]))
+
+    def test_export(self):
+        fd = StringIO.StringIO()
+        graph.write(self.c, fd, 'json')
+        data = json.loads(fd.getvalue())
+        self.assertEqual(len(data['nodes']), 14)
+        self.assertEqual(len(data['edges']), 22)
+        labels = set(n['label'] for n in data['nodes'])
+        self.assertIn('action#%d' % (self.mitigations.get(0)._id,), labels)
+
+        dot = ''.join(graph.to_dot(self.c))
+        self.assertTrue(dot.startswith('digraph "gatelogic" {\n'))
+        self.assertEqual(dot.count(' -> '), 22)
+
+
+if __name__ == '__main__':
+    unittest.main()
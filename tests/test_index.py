@@ -0,0 +1,143 @@
+import gatelogic
+import json
+import unittest
+
+
+class TestIndex(unittest.TestCase):
+    def test_lookup(self):
+        c = gatelogic.Controller()
+        signals = gatelogic.ReadableHub(c)
+        zones = gatelogic.ComputableHub(c)
+        signals.update({'a': ('z1', 1), 'b': ('z1', 2), 'c': ('z2', 3)})
+        signals.add_index('zone', lambda key, value: value[0])
+
+        runs = []
+        def total(zone):
+            runs.append(zone)
+            return sum(v[1] for v in signals.lookup('zone', zone).values())
+
+        for zone in ('z1', 'z2', 'z3'):
+            zones.maintain(zone, total, zone)
+        self.assertEqual(zones.dump(), {'z1': 3, 'z2': 3, 'z3': 0})
+        # one dependency per zone, none on the signal cells
+        self.assertEqual(c._refcount(signals.get('a')), 1)
+
+        del runs[:]
+        signals.update({'a': ('z1', 5), 'b': ('z1', 2), 'c': ('z3', 3)})
+        self.assertEqual(sorted(runs), ['z1', 'z2', 'z3'])
+        self.assertEqual(zones.dump(), {'z1': 7, 'z2': 0, 'z3': 3})
+
+        del runs[:]
+        signals.update({'a': ('z1', 5), 'b': ('z1', 2), 'c': ('z3', 3),
+                        'd': ('z2', 1)})
+        self.assertEqual(runs, ['z2'])
+        self.assertEqual(signals.lookup('zone', 'z2'), {'d': ('z2', 1)})
+
+        for zone in ('z1', 'z2', 'z3'):
+            zones.unmaintain(zone)
+        signals.update({})
+        self.assertTrue(c.is_empty())
+        self.assertEqual(signals._indexes['zone'][1], {})
+
+    def test_range(self):
+        c = gatelogic.Controller()
+        confirms = gatelogic.ReadableHub(c)
+        counts = gatelogic.ComputableHub(c)
+        confirms.update({'www.a': 1, 'api.a': 2, 'www.b': 3})
+
+        runs = []
+        def count(prefix):
+            runs.append(prefix)
+            return [k for k, _ in confirms.prefix(prefix)]
+
+        counts.maintain('www', count, 'www.')
+        counts.maintain('all', count, '')
+        self.assertEqual(counts.get('www').value, ['www.a', 'www.b'])
+        self.assertEqual(confirms.range('b', 'www.b'),
+                         [('www.a', 1)])
+
+        del runs[:]
+        confirms.apply_delta(added={'api.b': 4})
+        self.assertEqual(runs, [''])
+        confirms.apply_delta(added={'www.0': 5}, removed=['www.a'])
+        self.assertEqual(counts.get('www').value, ['www.0', 'www.b'])
+
+        counts.unmaintain('www')
+        counts.unmaintain('all')
+        self.assertEqual(confirms._ranges, {})
+        confirms.update({})
+        self.assertTrue(c.is_empty())
+
+    def test_prefix_unicode(self):
+        c = gatelogic.Controller()
+        confirms = gatelogic.ReadableHub(c)
+        # keys decoded from JSON are unicode
+        confirms.update(json.loads('{"caf\\u00e9": 1, "caf\\u0101": 2, '
+                                   '"cab": 3, "d": 4, "\\u0101\\uffff": 5}'))
+        self.assertEqual([k for k, _ in confirms.prefix(u'ca')],
+                         [u'cab', u'caf\xe9', u'caf\u0101'])
+        self.assertEqual(confirms.prefix(u'caf\xe9'), [(u'caf\xe9', 1)])
+        self.assertEqual(confirms.prefix(u'caf\u0100'), [])
+        self.assertEqual(confirms.prefix(u'\u0101\uffff'),
+                         [(u'\u0101\uffff', 5)])
+        self.assertEqual([k for k, _ in confirms.prefix('c')],
+                         [u'cab', u'caf\xe9', u'caf\u0101'])
+
+
+    def test_query_hub(self):
+        c = gatelogic.Controller()
+        q = gatelogic.QueryHub(c)
+        egress = gatelogic.ComputableHub(c)
+        q.update({'x1': 1, 'x2': 2})
+        q.add_index('parity', lambda key, value: value and value % 2)
+
+        # keys created by get() within a computation update the scans
+        egress.maintain('scan', lambda: [k for k, _ in q.range('x')])
+        egress.maintain('odd', lambda: sorted(q.lookup('parity', 1)))
+        egress.maintain('x1', lambda: q.get('x1').value)
+        self.assertEqual(egress.get('scan').value, ['x1'])
+        self.assertEqual(egress.get('odd').value, ['x1'])
+        egress.maintain('x2', lambda: q.get('x2').value)
+        self.assertEqual(egress.get('scan').value, ['x1', 'x2'])
+
+        q.update({'x1': 3, 'x2': 5})
+        self.assertEqual(egress.get('odd').value, ['x1', 'x2'])
+
+        for k in ('scan', 'odd', 'x1', 'x2'):
+            egress.unmaintain(k)
+        self.assertEqual(q.keys(), [])
+        q.update({})
+        self.assertTrue(c.is_empty())
+    def test_computed(self):
+        c = gatelogic.Controller()
+        signals = gatelogic.ReadableHub(c)
+        mitigations = gatelogic.ComputableHub(c)
+        lazy = gatelogic.LazyComputableHub(c)
+        zones = gatelogic.ComputableHub(c)
+        signals.update({'a': 'z1', 'b': 'z2'})
+        mitigations.add_index('zone', lambda key, value: value[0])
+        lazy.add_index('zone', lambda key, value: value[0])
+
+        # cells added by map_from() are indexed once computed
+        mitigations.map_from(signals, lambda row: (row.value, 'block'))
+        lazy.map_from(signals, lambda row: (row.value, 'log'))
+        zones.maintain('z1', lambda: sorted(mitigations.lookup('zone', 'z1')))
+        zones.maintain('lazy', lambda: sorted(lazy.lookup('zone', 'z1')))
+        self.assertEqual(zones.get('z1').value, ['a'])
+        self.assertEqual(zones.get('lazy').value, [])
+        lazy.dump()
+        self.assertEqual(zones.get('lazy').value, ['a'])
+
+        signals.update({'a': 'z2', 'b': 'z2', 'c': 'z1'})
+        self.assertEqual(zones.get('z1').value, ['c'])
+
+        for k in ('z1', 'lazy'):
+            zones.unmaintain(k)
+        mitigations.unmap_from(signals)
+        lazy.unmap_from(signals)
+        signals.update({})
+        self.assertTrue(c.is_empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
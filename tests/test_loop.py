@@ -0,0 +1,100 @@
+import gatelogic
+import Queue
+import threading
+import time
+import unittest
+
+
+class TestLoop(unittest.TestCase):
+    def test_loop(self):
+        c = gatelogic.Controller()
+        loop = gatelogic.EventLoop(c)
+
+        signals = gatelogic.ReadableHub(c)
+        egress = gatelogic.ComputableHub(c)
+        signals.update({1: 0, 2: 0})
+
+        def action():
+            return signals.get(1).value + signals.get(2).value
+
+        loop.submit(egress.maintain, 'sum', action)
+        self.assertEqual(loop.run_once(), 1)
+        cell = egress.get('sum')
+
+        thread = threading.Thread(target=loop.run)
+        thread.start()
+        try:
+            source = Queue.Queue()
+            loop.feed(signals, iter(source.get, None))
+
+            timer = threading.Timer(0.1, source.put, [{1: 1, 2: 2}])
+            timer.start()
+            self.assertEqual(loop.wait_changed(cell, 5), 3)
+
+            timer = threading.Timer(0.1, source.put, [{1: 10, 2: 2}])
+            timer.start()
+            self.assertEqual(loop.wait_changed(cell, 5), 12)
+            with self.assertRaises(Queue.Empty):
+                loop.wait_changed(signals.get(2), 0.01)
+        finally:
+            loop.stop()
+            thread.join()
+        self.assertEqual(signals.dump(), {1: 10, 2: 2})
+        self.assertEqual(cell.value, 12)
+
+    def test_batched(self):
+        c = gatelogic.Controller()
+        loop = gatelogic.EventLoop(c)
+
+        hub = gatelogic.QueryHub(c)
+        egress = gatelogic.ComputableHub(c)
+        counter = [0]
+
+        def action():
+            counter[0] += 1
+            return (hub.get('a').value, hub.get('b').value)
+
+        egress.maintain('1', action)
+        loop.submit(hub.update, {'a': 1})
+        loop.submit(hub.update, {'b': 2})
+        self.assertEqual(loop.run_once(0), 2)
+        self.assertEqual(counter[0], 2)
+        self.assertEqual(egress.get('1').value, (1, 2))
+        self.assertEqual(loop.run_once(0), 0)
+
+        with self.assertRaises(RuntimeError):
+            loop.wait_changed(egress.get('1'))
+
+    def test_timers(self):
+        c = gatelogic.Controller()
+        loop = gatelogic.EventLoop(c)
+        hub = gatelogic.ComputableHub(c)
+        deadline = time.time() + 0.05
+        cell = hub.maintain('expired', c.at, deadline)
+        self.assertEqual(cell.value, False)
+
+        # wakes up for the timer, not after the timeout
+        t0 = time.time()
+        self.assertEqual(loop.run_once(10), 0)
+        self.assertTrue(time.time() - t0 < 5)
+        self.assertEqual(cell.value, True)
+        hub.unmaintain('expired')
+        self.assertEqual(c.next_timer(), None)
+
+
+    def test_sink(self):
+        c = gatelogic.Controller()
+        loop = gatelogic.EventLoop(c)
+        hub = gatelogic.ReadableHub(c)
+        flushed = []
+        sink = gatelogic.Sink(hub, flushed.append, debounce=0.05)
+
+        loop.submit(hub.update, {'a': 1})
+        self.assertEqual(loop.run_once(0), 1)
+        self.assertEqual(flushed, [])
+        # wakes up for the debounced flush, without any event
+        t0 = time.time()
+        self.assertEqual(loop.run_once(10), 0)
+        self.assertTrue(time.time() - t0 < 5)
+        self.assertEqual(flushed, [{'a': 1}])
+        sink.close()
@@ -0,0 +1,88 @@
+import gatelogic
+import os
+import unittest
+
+
+class TestShard(unittest.TestCase):
+    def test_shards(self):
+        c = gatelogic.Controller()
+        signals = gatelogic.ReadableHub(c)
+        toggle_hub = gatelogic.QueryHub(c)
+        signals.update(dict((i, i) for i in range(20)))
+        toggle_hub.update({'enabled': 'True'})
+
+        def setup(c, inputs):
+            signals, toggle_hub = inputs
+            mitigations = gatelogic.ComputableHub(c)
+            def action(row):
+                if toggle_hub.get('enabled').value != 'True':
+                    return None
+                return (row.value * 2, os.getpid())
+            mitigations.map_from(signals, action)
+            return mitigations
+
+        hub = gatelogic.ShardedComputableHub(c, setup, 2, [signals],
+                                             [toggle_hub])
+        try:
+            hub.sync()
+            dump = hub.dump()
+            self.assertEqual(sorted(dump), range(20))
+            self.assertEqual([v[0] for k, v in sorted(dump.items())],
+                             [i * 2 for i in range(20)])
+            self.assertEqual(len(set(v[1] for v in dump.values())), 2)
+            # the workers' request reached the shared QueryHub
+            self.assertEqual(toggle_hub.keys(), ['enabled'])
+
+            signals.update(dict((i, i + 1) for i in range(10)))
+            hub.sync()
+            self.assertEqual(sorted(hub.keys()), range(10))
+            self.assertEqual(hub.get(3).value[0], 8)
+
+            toggle_hub.update({'enabled': 'False'})
+            hub.sync()
+            self.assertEqual(hub.dump().values(), [None] * 10)
+        finally:
+            hub.close()
+        self.assertEqual(toggle_hub.keys(), [])
+
+
+    def test_partitioned_query(self):
+        c = gatelogic.Controller()
+        signals = gatelogic.ReadableHub(c)
+        conf = gatelogic.QueryHub(c)
+        signals.update({0: 'k1', 1: 'k1'})
+        conf.update({'k1': 'yes', 'k2': 'two'})
+
+        def setup(c, inputs):
+            signals, conf = inputs
+            mitigations = gatelogic.ComputableHub(c)
+            mitigations.map_from(signals, lambda row: conf.get(row.value).value)
+            return mitigations
+
+        shards = {0: 0, 1: 1, 2: 1, 'k1': 0, 'k2': 1}
+        hub = gatelogic.ShardedComputableHub(c, setup, 2, [signals, conf],
+                                             shard_of=shards.get)
+        try:
+            # keys read on other shards than their own reach them too
+            hub.sync()
+            self.assertEqual(hub.dump(), {0: 'yes', 1: 'yes'})
+            conf.update({'k1': 'no', 'k2': 'two'})
+            hub.sync()
+            self.assertEqual(hub.dump(), {0: 'no', 1: 'no'})
+            signals.update({0: 'k2', 1: 'k1', 2: 'k1'})
+            hub.sync()
+            self.assertEqual(hub.dump(), {0: 'two', 1: 'no', 2: 'no'})
+            # asked again while still read by its own shard
+            signals.update({0: 'k1', 1: 'k2'})
+            hub.sync()
+            conf.update({'k1': 'new', 'k2': 'two'})
+            hub.sync()
+            signals.update({0: 'k1', 1: 'k1'})
+            hub.sync()
+            self.assertEqual(hub.dump(), {0: 'new', 1: 'new'})
+        finally:
+            hub.close()
+        self.assertEqual(conf.keys(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import Queue
+import gatelogic
+import unittest
+
+
+class TestSink(unittest.TestCase):
+    def test_snapshot(self):
+        c = gatelogic.Controller()
+        signals = gatelogic.ReadableHub(c)
+        egress = gatelogic.ComputableHub(c)
+
+        def action(row):
+            return row.value * 2
+
+        def on_new(_, kind, k, row):
+            if kind == 'add':
+                egress.maintain(k, action, row)
+            if kind == 'delete':
+                egress.unmaintain(k)
+        c.subscribe(signals, on_new)
+
+        flushed = []
+        sink = gatelogic.Sink(egress, flushed.append)
+
+        signals.update(dict((i, i) for i in range(100)))
+        self.assertEqual(len(flushed), 1)
+        self.assertEqual(flushed[0], dict((i, i * 2) for i in range(100)))
+
+        signals.update(dict((i, i + 1) for i in range(50)))
+        self.assertEqual(len(flushed), 2)
+        self.assertEqual(flushed[1][0], 2)
+
+        # nothing changed, nothing written
+        signals.update(dict((i, i + 1) for i in range(50)))
+        self.assertEqual(len(flushed), 2)
+
+        sink.close()
+        c.unsubscribe(signals, on_new)
+        signals.update({})
+        for k in egress.keys():
+            egress.unmaintain(k)
+        self.assertTrue(c.is_empty())
+
+    def test_delta(self):
+        c = gatelogic.Controller()
+        hub = gatelogic.ReadableHub(c)
+        hub.update({1: 1, 2: 2})
+
+        flushed = []
+        sink = gatelogic.Sink(hub, flushed.append, mode='delta')
+
+        with c.batch():
+            hub.update({1: 10, 3: 3})
+            hub.update({1: 11, 3: 3, 4: 4})
+            hub.update({1: 11, 2: 2, 4: 4})
+        # 2 was deleted and added back, 3 added and deleted
+        self.assertEqual(flushed, [[('set', 1, 11), ('set', 2, 2),
+                                    ('add', 4, 4)]])
+        sink.close()
+
+    def test_debounce(self):
+        now = [0]
+        c = gatelogic.Controller()
+        hub = gatelogic.ReadableHub(c)
+
+        flushed = []
+        sink = gatelogic.Sink(hub, flushed.append, debounce=1,
+                              max_latency=3, clock=lambda: now[0])
+        self.assertEqual(sink.deadline(), None)
+
+        hub.update({1: 1})
+        self.assertEqual(flushed, [])
+        self.assertEqual(sink.deadline(), 1)
+
+        now[0] = 0.5
+        hub.update({1: 2})
+        now[0] = 1.2
+        sink.poll()
+        self.assertEqual(flushed, [])
+        self.assertEqual(sink.deadline(), 1.5)
+
+        now[0] = 2.9
+        hub.update({1: 3})
+        self.assertEqual(sink.deadline(), 3)
+        now[0] = 3
+        hub.update({1: 4})
+        self.assertEqual(flushed, [{1: 4}])
+        self.assertFalse(sink.pending())
+
+        now[0] = 5
+        hub.update({})
+        sink.close()
+        self.assertEqual(flushed, [{1: 4}, {}])
+
+    def test_debounce_timer(self):
+        now = [0]
+        c = gatelogic.Controller(clock=lambda: now[0])
+        hub = gatelogic.ReadableHub(c)
+
+        # a quiet hub is flushed by the controller's timers
+        flushed = []
+        sink = gatelogic.Sink(hub, flushed.append, debounce=1, max_latency=3)
+        hub.update({1: 1})
+        self.assertEqual(c.next_timer(), 1)
+        now[0] = 0.5
+        hub.update({1: 2})
+        now[0] = 1
+        self.assertEqual(c.run_timers(), 1.5)
+        self.assertEqual(flushed, [])
+        now[0] = 1.5
+        self.assertEqual(c.run_timers(), None)
+        self.assertEqual(flushed, [{1: 2}])
+
+        now[0] = 2
+        hub.update({1: 3})
+        sink.close()
+        self.assertEqual(flushed, [{1: 2}, {1: 3}])
+        now[0] = 3
+        self.assertEqual(c.run_timers(), None)
+        self.assertEqual(len(flushed), 2)
+
+    def test_changefeed(self):
+        c = gatelogic.Controller()
+        signals = gatelogic.ReadableHub(c)
+        signals.update({'a': 1, 'b': 2})
+
+        sets = []
+        feed = gatelogic.Changefeed(signals, sets.append)
+        signals.update({'a': 1, 'b': 3, 'c': 4})
+        self.assertEqual(sets, [gatelogic.ChangeSet(
+            added={'c': 4}, removed={}, changed={'b': (2, 3)})])
+
+        # changed back within one batch, nothing to report
+        with c.batch():
+            signals.update({'a': 1, 'b': 5})
+            signals.update({'a': 1, 'b': 3, 'c': 4})
+        self.assertEqual(len(sets), 1)
+
+        signals.update({'a': 2})
+        self.assertEqual(sets[1], gatelogic.ChangeSet(
+            added={}, removed={'b': 3, 'c': 4}, changed={'a': (1, 2)}))
+        feed.close()
+
+        # consumed from another thread
+        feed = gatelogic.Changefeed(signals, maxsize=1)
+        signals.update({'a': 3})
+        self.assertEqual(feed.get(1).changed, {'a': (2, 3)})
+        self.assertRaises(Queue.Empty, feed.get, 0.01)
+        feed.close()
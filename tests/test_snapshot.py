@@ -0,0 +1,86 @@
+import gatelogic
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmp, 'state')
+        self.runs = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def build(self):
+        c = gatelogic.Controller()
+        hubs = {
+            'signals': gatelogic.ReadableHub(c),
+            'toggles': gatelogic.QueryHub(c),
+            'mitigations': gatelogic.ComputableHub(c),
+        }
+        def action(row):
+            self.runs.append(row)
+            if hubs['toggles'].get('enabled').value != 'True':
+                return None
+            return hubs['signals'].get(row).value * 2
+        return c, hubs, action
+
+    def maintain(self, hubs, action):
+        hubs['mitigations'].maintain_many(
+            (k, action, k) for k in hubs['signals'].keys())
+
+    def test_restore(self):
+        c, hubs, action = self.build()
+        hubs['signals'].update({'a': 1, 'b': 2, 'c': 3}, {'serial': 7})
+        hubs['toggles'].update({'enabled': 'True'})
+        self.maintain(hubs, action)
+        self.assertEqual(hubs['mitigations'].dump(),
+                         {'a': 2, 'b': 4, 'c': 6})
+        c.snapshot(self.fname, hubs)
+
+        del self.runs[:]
+        c, hubs, action = self.build()
+        c.restore(self.fname, hubs)
+        self.assertEqual(hubs['signals'].extra, {'serial': 7})
+        self.maintain(hubs, action)
+        self.assertEqual(self.runs, [])
+        self.assertEqual(c.counters()['cells_restored'], 3)
+        self.assertEqual(hubs['mitigations'].dump(),
+                         {'a': 2, 'b': 4, 'c': 6})
+
+        # restored cells follow their inputs again
+        hubs['signals'].update({'a': 1, 'b': 5, 'c': 3})
+        self.assertEqual(self.runs, ['b'])
+        self.assertEqual(hubs['mitigations'].get('b').value, 10)
+        hubs['toggles'].update({'enabled': 'False'})
+        self.assertEqual(sorted(self.runs), ['a', 'b', 'b', 'c'])
+        self.assertEqual(hubs['mitigations'].dump(),
+                         {'a': None, 'b': None, 'c': None})
+
+    def test_changed_inputs(self):
+        c, hubs, action = self.build()
+        hubs['signals'].update({'a': 1, 'b': 2})
+        hubs['toggles'].update({'enabled': 'True'})
+        self.maintain(hubs, action)
+        c.snapshot(self.fname, hubs)
+
+        # inputs polled again before the cells are maintained
+        del self.runs[:]
+        c, hubs, action = self.build()
+        c.restore(self.fname, hubs)
+        hubs['signals'].update({'a': 1, 'b': 3})
+        self.maintain(hubs, action)
+        self.assertEqual(self.runs, ['b'])
+        self.assertEqual(hubs['mitigations'].dump(), {'a': 2, 'b': 6})
+
+        for k in hubs['signals'].keys():
+            hubs['mitigations'].unmaintain(k)
+        hubs['signals'].update({})
+        self.assertTrue(c.is_empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
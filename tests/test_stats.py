@@ -0,0 +1,51 @@
+import gatelogic
+import unittest
+
+
+class TestStats(unittest.TestCase):
+    def test_stats(self):
+        c = gatelogic.Controller()
+        toggle_hub = gatelogic.ReadableHub(c)
+        mitigations = gatelogic.ComputableHub(c)
+        toggle_hub.update({'enabled': 'True'})
+
+        stats = gatelogic.Stats()
+        self.assertEqual(c.set_stats(stats), None)
+        stats.name(toggle_hub, 'toggles')
+
+        def action(i):
+            if toggle_hub.get('enabled').value != 'True':
+                return None
+            return i
+
+        for i in range(20):
+            mitigations.maintain(i, action, i)
+        toggle_hub.update({'enabled': 'False'})
+
+        self.assertEqual(stats.functions()['action'][0], 40)
+        self.assertEqual(len(stats.top(5)), 5)
+        snapshot = stats.snapshot()
+        # the toggle cell is read by 20 cells and by its hub
+        self.assertEqual(snapshot['fanout']['max'], 21)
+        self.assertEqual(snapshot['subscribed'], 40)
+        self.assertEqual(snapshot['unsubscribed'], 0)
+        self.assertEqual(snapshot['hub_updates']['toggles'][0], 1)
+
+        text = stats.prometheus()
+        self.assertIn('gatelogic_cell_runs_total{function="action"} 40\n', text)
+        self.assertIn('gatelogic_dirty_fanout_bucket{le="+Inf"} ', text)
+        self.assertIn('gatelogic_hub_updates_total{hub="toggles"} 1\n', text)
+
+        # disabled, nothing more is collected
+        self.assertIs(c.set_stats(None), stats)
+        toggle_hub.update({'enabled': 'True'})
+        self.assertEqual(stats.functions()['action'][0], 40)
+
+        for i in range(20):
+            mitigations.unmaintain(i)
+        toggle_hub.update({})
+        self.assertTrue(c.is_empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
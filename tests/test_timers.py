@@ -0,0 +1,87 @@
+import gatelogic
+import unittest
+
+
+class TestTimers(unittest.TestCase):
+    def setUp(self):
+        self.time = [100.0]
+        self.c = gatelogic.Controller(clock=lambda: self.time[0])
+
+    def test_at(self):
+        c = self.c
+        signals = gatelogic.ReadableHub(c)
+        mitigations = gatelogic.ComputableHub(c)
+        signals.update({'a': 130, 'b': 160})
+
+        runs = []
+        def action(row):
+            runs.append(row.value)
+            # expire the mitigation at the given time
+            if c.at(row.value):
+                return None
+            return 'block'
+
+        mitigations.map_from(signals, action)
+        self.assertEqual(c.next_timer(), 130)
+
+        self.time[0] = 129
+        self.assertEqual(c.run_timers(), 130)
+        self.assertEqual(len(runs), 2)
+
+        # only the expired cell is recomputed
+        self.time[0] = 140
+        self.assertEqual(c.run_timers(), 160)
+        self.assertEqual(runs[2:], [130])
+        self.assertEqual(mitigations.dump(), {'a': None, 'b': 'block'})
+
+        # deadlines nobody waits for anymore are forgotten
+        mitigations.unmap_from(signals)
+        self.assertEqual(c._deadlines, {})
+        self.time[0] = 200
+        self.assertEqual(c.run_timers(), None)
+        signals.update({})
+        self.assertTrue(c.is_empty())
+
+    def test_now(self):
+        c = self.c
+        minutes = gatelogic.ComputableHub(c)
+        cell = minutes.maintain('minute', lambda: c.now(60) / 60)
+        self.assertEqual(cell.value, 1)
+        self.time[0] = 119
+        c.run_timers()
+        self.assertEqual(cell.value, 1)
+        self.time[0] = 185
+        c.run_timers()
+        self.assertEqual(cell.value, 3)
+        self.assertEqual(c.next_timer(), 240)
+
+    def test_ttl(self):
+        c = self.c
+        signals = gatelogic.ReadableHub(c, ttl=10)
+        signals.update({'a': 1, 'b': 2})
+        self.time[0] = 105
+        signals.apply_delta(changed={'a': 1})
+        self.time[0] = 111
+        c.run_timers()
+        self.assertEqual(signals.keys(), ['a'])
+        self.time[0] = 116
+        self.assertEqual(c.run_timers(), None)
+        self.assertEqual(signals.keys(), [])
+        self.assertTrue(c.is_empty())
+
+        # a flapping key keeps a single timer
+        for i in range(5):
+            self.time[0] = 120 + i
+            signals.update({'a': i})
+            signals.update({})
+        signals.update({'a': 5})
+        self.assertEqual(len(c._timers), 1)
+        self.assertEqual(c.run_timers(), 130)
+        self.time[0] = 134
+        self.assertEqual(c.run_timers(), None)
+        self.assertEqual(signals.keys(), [])
+        self.assertEqual(signals._expires, {})
+
+
+if __name__ == '__main__':
+    unittest.main()